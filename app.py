@@ -2,6 +2,7 @@
 import streamlit as st
 import json
 import os
+from collections import deque
 from dotenv import load_dotenv
 
 from src.database import VectorStore
@@ -29,6 +30,10 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# 대화 기록 보관/렌더링 한도 (rerun마다 전체 markdown을 다시 그리지 않도록 최근 것만 표시)
+MAX_HISTORY     = 200
+RECENT_MESSAGES = 20
+
 PROJECT_MAP = {
     "🌐 TIDAL codebase": "semiconductor_codebase_tidal",
     "Dreamer codebase":  "semiconductor_codebase",
@@ -43,32 +48,47 @@ with st.sidebar:
     target_collection = PROJECT_MAP[selected_project]
     st.caption(f"Qdrant: `{target_collection}`")
     if st.button("대화 초기화"):
-        st.session_state.messages = []
+        st.session_state.messages = deque(maxlen=MAX_HISTORY)
         st.rerun()
 
 # ── 엔진 초기화 ───────────────────────────────────────────────────────────────
-if (
-    "current_collection" not in st.session_state
-    or st.session_state.current_collection != target_collection
-):
-    st.session_state.current_collection = target_collection
-    st.session_state.messages = []
+# 임베딩 모델 / DB 커넥션 풀은 프로세스 전역 싱글톤으로 공유 (rerun·다중 탭에서 재로딩 방지)
+# VectorStore는 컬렉션 이름으로 쿼리를 나누지 않음(모든 프로젝트가 같은 code_chunks 테이블) →
+# 프로젝트별로 캐시하면 같은 데이터에 모델·커넥션 풀만 중복 적재되므로 하나만 유지
+# (서버 실행 중 인제스트된 청크는 SmartSearchEngine이 DB 지문을 주기적으로 확인해 BM25/정확 매칭에 반영)
+@st.cache_resource(show_spinner="엔진 로딩 중... ⏳")
+def get_stores():
+    vector_store  = VectorStore()
+    graph_store   = GraphStore()
+    search_engine = SmartSearchEngine(vector_store, graph_store)
+    agent         = CodebaseAgent(search_engine, vector_store, graph_store)
+    return vector_store, graph_store, search_engine, agent
+
 
-    with st.spinner("엔진 로딩 중... ⏳"):
-        vector_store  = VectorStore(collection_name=target_collection)
-        graph_store   = GraphStore()
-        search_engine = SmartSearchEngine(vector_store, graph_store)
-        llm           = LocalLLM()
-        agent         = CodebaseAgent(search_engine, vector_store, graph_store)
+@st.cache_resource
+def get_llm() -> LocalLLM:
+    return LocalLLM()
 
-        st.session_state.vector_store  = vector_store
-        st.session_state.graph_store   = graph_store
-        st.session_state.search_engine = search_engine
-        st.session_state.llm           = llm
-        st.session_state.agent         = agent
+
+if st.session_state.get("current_collection") != target_collection:
+    st.session_state.current_collection = target_collection
+    st.session_state.messages = deque(maxlen=MAX_HISTORY)
+
+vector_store, graph_store, search_engine, agent = get_stores()
+llm = get_llm()
 
 # ── 대화 기록 ────────────────────────────────────────────────────────────────
-for msg in st.session_state.messages:
+history = list(st.session_state.messages)
+older, recent = history[:-RECENT_MESSAGES], history[-RECENT_MESSAGES:]
+
+if older:
+    with st.expander(f"이전 대화 {len(older)}개 보기"):
+        if st.checkbox("불러오기", key="show_older_messages"):
+            for msg in older:
+                with st.chat_message(msg["role"]):
+                    st.markdown(msg["content"])
+
+for msg in recent:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
 
@@ -76,14 +96,13 @@ for msg in st.session_state.messages:
 query = st.chat_input("코드에 대해 무엇이든 물어보세요!")
 
 if query:
+    # 에이전트 도구가 검색 전에 청크 목록을 먼저 볼 수 있으므로 질의 시작 시점에 갱신 여부 확인
+    search_engine.refresh_if_stale()
     st.session_state.messages.append({"role": "user", "content": query})
     with st.chat_message("user"):
         st.markdown(query)
 
     with st.chat_message("assistant"):
-        agent: CodebaseAgent = st.session_state.agent
-        llm:   LocalLLM      = st.session_state.llm
-
         tool_placeholder     = st.empty()
         response_placeholder = st.empty()
         full_answer          = ""
@@ -1,56 +1,271 @@
 import os
 import sys
-import json
-import hashlib
+import orjson
+import pickle
+import argparse
+import blake3
+import shutil
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.progress import track
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import repeat
 
 from src.models import CodeChunk
 from src.parser import ASTParser
 from src.graph_builder import GraphBuilder
-from src.database import VectorStore
-from src.graph_store import GraphStore
-from src.path_utils import should_skip_path
+from src.path_utils import should_skip_path, should_skip_name
 
 load_dotenv()
 console = Console()
 
 STATE_FILE = ".ingest_state.json"
+# 파서/청크 구조가 바뀌면 버전을 올려 기존 캐시를 통째로 무효화
+CHUNK_CACHE_VERSION = 3
+CHUNK_CACHE_DIR = Path(".ingest_cache") / f"v{CHUNK_CACHE_VERSION}"
+HASH_ALGO = "blake3"
+HASH_READ_SIZE = 1024 * 1024
+EMPTY_FILE_HASH = blake3.blake3(b"").hexdigest()
+HASH_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+HASH_STATUS_EVERY = 200
+VERBOSE_LIST_LIMIT = 20
+PARSE_WORKERS = os.cpu_count() or 1
+PARSE_POOL_MIN_FILES = 16
 SUPPORTED_EXTENSIONS = {".py", ".cs", ".xaml", ".cpp", ".h", ".hpp", ".c"}
+# 이보다 큰 소스 파일은 대부분 자동 생성 코드 → 해싱/파싱 대상에서 제외
+MAX_SOURCE_FILE_SIZE = int(os.getenv("MAX_SOURCE_FILE_SIZE", 2 * 1024 * 1024))
 FORCE_REINDEX = os.getenv("FORCE_REINDEX", "false").lower() == "true"
+# 증분 인제스트라도 기존 청크 수 대비 이 비율 이상을 다시 쓰면 적재 후 HNSW 인덱스를 새로 빌드해 교체
+BULK_LOAD_RATIO = 0.3
 
 
-def calculate_file_hash(filepath: Path) -> str:
-    hash_md5 = hashlib.md5()
+def calculate_file_hash(filepath: str) -> str:
+    # 암호학적 강도는 불필요하므로 SIMD 가속되는 BLAKE3 사용
+    hash_obj = blake3.blake3()
     try:
         with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            for chunk in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                hash_obj.update(chunk)
+        return hash_obj.hexdigest()
     except FileNotFoundError:
         return ""
 
 
+def iter_source_files(source_path: Path, extensions: set[str] = SUPPORTED_EXTENSIONS):
+    """
+    인덱싱 대상 소스 파일을 디렉토리 순회 도중 즉시 (경로 문자열, stat)으로 yield (전체 목록을 만들지 않음).
+    os.scandir의 d_type 캐시로 stat 호출을 줄이고, 제외 디렉토리는 하위 트리 전체를 건너뜁니다.
+    """
+    if should_skip_path(source_path, source_path):
+        return
+
+    stack = [str(source_path)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+
+        for entry in entries:
+            # 상위 디렉토리는 이미 통과했으므로 이름만 검사하면 충분
+            if should_skip_name(entry.name):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            if entry.name.endswith('.xaml.cs'):
+                continue
+            if not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if stat.st_size > MAX_SOURCE_FILE_SIZE:
+                console.print(f"[dim]⏭️  Skipping large file ({stat.st_size // 1024} KB): {entry.path}[/dim]")
+                continue
+
+            yield entry.path, stat
+
+
+def hash_files(file_entries, reuse_hash=None, max_in_flight: int = HASH_WORKERS * 4):
+    """
+    (path, stat) 스트림을 스레드 풀에서 해싱하여 (path, stat, hash)를 입력 순서대로 yield.
+    reuse_hash(path, stat)가 해시를 돌려주면 파일을 읽지 않고 그 값을 그대로 사용합니다.
+    대기 중인 작업 수를 max_in_flight로 제한해 순회와 해싱을 겹치면서 메모리 사용을 억제합니다.
+    """
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        pending = deque()
+        for file_path, stat in file_entries:
+            known = reuse_hash(file_path, stat) if reuse_hash else None
+            pending.append((file_path, stat, known or executor.submit(calculate_file_hash, file_path)))
+            if len(pending) >= max_in_flight:
+                done_path, done_stat, result = pending.popleft()
+                yield done_path, done_stat, result if isinstance(result, str) else result.result()
+        while pending:
+            done_path, done_stat, result = pending.popleft()
+            yield done_path, done_stat, result if isinstance(result, str) else result.result()
+
+
+# tree-sitter 파서는 pickle 불가 → 워커 프로세스마다 ASTParser를 한 번씩 생성
+_worker_parser = None
+
+
+def _init_parse_worker():
+    global _worker_parser
+    _worker_parser = ASTParser()
+
+
+def _parse_one(filepath: str, content_hash: str, refresh: bool = False) -> tuple[str, list[CodeChunk], Optional[str]]:
+    # 예외도 결과로 돌려줘 한 파일의 실패가 배치(chunksize) 내 다른 파일 결과를 잃게 하지 않음
+    try:
+        return filepath, load_chunks_cached(_worker_parser, filepath, content_hash, refresh), None
+    except Exception as e:
+        return filepath, [], str(e)
+
+
+def _chunk_cache_path(filepath: str, content_hash: str) -> Path:
+    # 청크에 파일 경로/FQN이 들어가므로 내용 해시만이 아니라 경로까지 키에 포함
+    key = blake3.blake3(f"{filepath}\0{content_hash}".encode("utf-8")).hexdigest()
+    return CHUNK_CACHE_DIR / key[:2] / f"{key[2:]}.pkl"
+
+
+def load_chunks_cached(parser: ASTParser, filepath: str, content_hash: str, refresh: bool = False) -> list[CodeChunk]:
+    """
+    파일 내용 해시 기준으로 파싱 결과를 디스크에 캐시합니다.
+    내용이 그대로인 파일(호출 관계 해석용 미변경 파일 등)은 tree-sitter 파싱을 건너뜁니다.
+    refresh=True(--full)면 캐시를 읽지 않고 다시 파싱해 덮어씀 → 파서/캐시 오류 복구 경로
+    """
+    if not content_hash:
+        return parser.parse(filepath)
+
+    cache_path = _chunk_cache_path(filepath, content_hash)
+    if not refresh:
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # 깨진 캐시 파일은 지우고 다시 파싱
+            cache_path.unlink(missing_ok=True)
+
+    chunks = parser.parse(filepath)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(chunks, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return chunks
+
+
+def prune_chunk_cache(keep: set[str]) -> int:
+    """현재 상태(경로+해시)에 없는 청크 캐시 파일과 이전 버전 캐시 디렉터리를 삭제합니다."""
+    cache_root = CHUNK_CACHE_DIR.parent
+    if cache_root.is_dir():
+        for entry in os.scandir(cache_root):
+            if (
+                entry.is_dir()
+                and entry.name[:1] == "v"
+                and entry.name[1:].isdigit()
+                and entry.name != CHUNK_CACHE_DIR.name
+            ):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    if not CHUNK_CACHE_DIR.is_dir():
+        return 0
+    removed = 0
+    for shard in os.scandir(CHUNK_CACHE_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            # 수정 전 버전의 캐시, 삭제된 파일의 캐시, 중단된 쓰기의 임시 파일
+            if entry.path not in keep:
+                try:
+                    os.unlink(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
 def load_state() -> dict:
     if os.path.exists(STATE_FILE):
         try:
-            with open(STATE_FILE, "r") as f:
-                return json.load(f)
+            with open(STATE_FILE, "rb") as f:
+                raw = orjson.loads(f.read())
         except Exception:
             return {}
-    return {}
+        if not isinstance(raw, dict):
+            return {}
 
+        if raw.get("hash_algo") == HASH_ALGO and isinstance(raw.get("files"), dict):
+            # 항목 형식: {"hash", "mtime_ns", "size"} (해시만 있는 이전 항목은 stat 비교 없이 재해싱)
+            return {
+                path: entry if isinstance(entry, dict) else {"hash": entry}
+                for path, entry in raw["files"].items()
+            }
 
-def save_state(state: dict):
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
+        # 이전 형식(경로→MD5 평면 dict 등): 경로는 유지해 삭제 감지는 살리고, 해시는 비워 전체 재처리
+        legacy_files = raw.get("files", raw)
+        return {path: {"hash": ""} for path in legacy_files if isinstance(path, str)}
+    return {}
 
 
-def main():
-    SOURCE_PATH = os.getenv("SOURCE_CODE_PATH", "./")
+def save_state(state: dict):
+    # 사람이 읽는 파일이 아니므로 들여쓰기 없이 직렬화하고, 중단되어도 이전 상태가 남도록 교체 방식으로 기록
+    tmp_path = f"{STATE_FILE}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps({"hash_algo": HASH_ALGO, "files": state}))
+    os.replace(tmp_path, STATE_FILE)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="소스코드를 파싱하여 PostgreSQL(pgvector)에 인덱싱합니다.")
+    arg_parser.add_argument(
+        "--source",
+        default=os.getenv("SOURCE_CODE_PATH", "./"),
+        help="분석할 코드 경로 (기본값: SOURCE_CODE_PATH)",
+    )
+    arg_parser.add_argument(
+        "--full",
+        action="store_true",
+        default=FORCE_REINDEX,
+        help="변경 여부와 무관하게 전체 파일 재인덱싱 (기본값: FORCE_REINDEX)",
+    )
+    arg_parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="신규/수정/삭제 파일 목록을 일부 출력",
+    )
+    arg_parser.add_argument(
+        "--extensions",
+        default=",".join(sorted(SUPPORTED_EXTENSIONS)),
+        help="인덱싱할 확장자 목록 (쉼표 구분, 예: .py,.cs)",
+    )
+    return arg_parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    full_reindex = args.full
+    extensions = {
+        ext.strip().lower() if ext.strip().startswith(".") else f".{ext.strip().lower()}"
+        for ext in args.extensions.split(",")
+        if ext.strip()
+    }
+
+    # 임베딩 모델/torch 로딩 비용이 크므로 --help 등에서는 import 하지 않음
+    from src.database import VectorStore
 
     #1. DB 초기화
     console.print("[bold cyan]🗄️  Initializing PostgreSQL...[/bold cyan]")
@@ -61,58 +276,137 @@ def main():
     # 2. 파일 스캔 및 변경 감지
     console.print("🔍 Phase 1: Detecting Changes...")
 
-    source_path = Path(SOURCE_PATH).resolve()
+    source_path = Path(args.source).resolve()
     old_state   = load_state()
-    current_state: dict[str, str] = {}
+    current_state: dict[str, dict] = {}
+    new_files: list[str] = []
+    modified_files: list[str] = []
     files_to_process: list[str] = []
-
-    for root, dirs, files in os.walk(source_path):
-        root_path = Path(root)
-
-        if should_skip_path(root_path, source_path):
-            dirs[:] = []  
-            continue
-
-        for file in files:
-            file_path = root_path / file
-
-            if should_skip_path(file_path, source_path):
-                continue
-            if file_path.suffix.lower() not in SUPPORTED_EXTENSIONS:
-                continue
-            if str(file_path).endswith('.xaml.cs'):
-                continue
-
-            file_hash = calculate_file_hash(file_path)
-            rel_path  = str(file_path.relative_to(source_path))
-            current_state[rel_path] = file_hash
-
+    process_hashes: dict[str, str] = {}
+
+    # scandir가 돌려주는 경로는 항상 루트 문자열로 시작 → Path.relative_to 대신 접두사 슬라이싱
+    root_prefix = os.path.join(str(source_path), "")
+
+    def reuse_hash(file_path: str, stat: os.stat_result) -> str:
+        # mtime과 크기가 이전 실행과 같으면 파일 내용을 다시 읽지 않고 저장된 해시 재사용
+        if stat.st_size == 0:
+            return EMPTY_FILE_HASH
+        old = old_state.get(file_path[len(root_prefix):])
+        if old and old.get("mtime_ns") == stat.st_mtime_ns and old.get("size") == stat.st_size:
+            return old.get("hash") or None
+        return None
+
+    # 전체 파일 수를 미리 알 수 없으므로(스트리밍 순회) 진행 바 대신 처리 개수만 갱신
+    with console.status("Hashing files...") as status:
+        for scanned, (file_path, stat, file_hash) in enumerate(
+            hash_files(iter_source_files(source_path, extensions), reuse_hash), 1
+        ):
+            rel_path  = file_path[len(root_prefix):]
+            current_state[rel_path] = {
+                "hash": file_hash, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+            }
+
+            # 파일별 출력 대신 분류만 기록하고 루프 이후 요약 출력
+            if rel_path not in old_state:
+                new_files.append(rel_path)
+            elif old_state[rel_path].get("hash") != file_hash:
+                modified_files.append(rel_path)
             if (
                 rel_path not in old_state
-                or old_state[rel_path] != file_hash
-                or FORCE_REINDEX
+                or old_state[rel_path].get("hash") != file_hash
+                or full_reindex
             ):
-                files_to_process.append(str(file_path))
-
-    deleted_files = set(old_state.keys()) - set(current_state.keys())
+                files_to_process.append(file_path)
+                process_hashes[file_path] = file_hash
+
+            if scanned % HASH_STATUS_EVERY == 0:
+                status.update(f"Hashing files... {scanned} scanned, {len(files_to_process)} changed")
+
+    # --extensions로 범위를 좁힌 실행: 대상 외 확장자의 기존 항목은 삭제로 보지 않고 상태에 그대로 유지
+    # (청크/엣지 삭제, 상태 누락, 파싱 캐시 정리 대상에서 모두 제외)
+    retained_state = {
+        rel_path: entry
+        for rel_path, entry in old_state.items()
+        if rel_path not in current_state and os.path.splitext(rel_path)[1].lower() not in extensions
+    }
+    deleted_files = set(old_state.keys()) - set(current_state.keys()) - set(retained_state.keys())
     if deleted_files:
-        console.print(f"🗑️  Found {len(deleted_files)} deleted files (manual cleanup may be needed).")
+        console.print(f"🗑️  Found {len(deleted_files)} deleted files.")
 
     if not files_to_process and not deleted_files:
         console.print("\n✅ No changes detected. System is up to date.")
+        current_state.update(retained_state)
         save_state(current_state)
         return
 
-    console.print(f"📦 Found {len(files_to_process)} files to process.")
+    console.print(
+        f"📦 Found {len(files_to_process)} files to process "
+        f"({len(new_files)} new, {len(modified_files)} modified)."
+    )
+    if args.verbose:
+        for label, names in (("+ New", new_files), ("* Modified", modified_files), ("- Deleted", sorted(deleted_files))):
+            for name in names[:VERBOSE_LIST_LIMIT]:
+                console.print(f"   [dim]{label}: {name}[/dim]")
+            if len(names) > VERBOSE_LIST_LIMIT:
+                console.print(f"   [dim]{label}: ... and {len(names) - VERBOSE_LIST_LIMIT} more[/dim]")
 
     #파싱
     console.print("\n[bold yellow]🔨 Phase 2: Parsing Code (Without LLM yet)...[/bold yellow]")
     parser = ASTParser()
     chunks_to_upsert: list[CodeChunk] = []
 
-    for filepath in track(files_to_process, description="Parsing files..."):
-        file_chunks = parser.parse(filepath)
-        chunks_to_upsert.extend(file_chunks)
+    # 파일별 파싱은 CPU 바운드이고 서로 독립적이므로 프로세스 풀로 병렬 처리
+    parsed_by_file: dict[str, list[CodeChunk]] = {}
+    # 변경 없는 파일은 업서트하지 않지만, 호출 관계 해석에는 전체 청크가 필요 → 청크 캐시에서 적재
+    changed_files = set(files_to_process)
+    graph_only_files: list[str] = []
+    parse_hashes = dict(process_hashes)
+    for rel_path, entry in current_state.items():
+        filepath = root_prefix + rel_path
+        if filepath not in changed_files:
+            graph_only_files.append(filepath)
+            parse_hashes[filepath] = entry["hash"]
+
+    def collect_parsed(filepath: str, chunks: list[CodeChunk]):
+        # 변경 파일은 순서 보존을 위해 보관, 그래프 전용 청크는 도착 즉시 등록해 파싱 대기 시간과 겹침
+        if filepath in changed_files:
+            parsed_by_file[filepath] = chunks
+        else:
+            for chunk in chunks:
+                graph_builder.add_chunk(chunk)
+
+    # 빈 파일은 청크가 나오지 않으므로 파싱 생략 (기존 청크 삭제 대상에는 그대로 포함)
+    files_to_parse = [
+        fp for fp in files_to_process + graph_only_files if parse_hashes[fp] != EMPTY_FILE_HASH
+    ]
+    if len(files_to_parse) < PARSE_POOL_MIN_FILES:
+        # 증분 실행처럼 파일이 적으면 워커 프로세스 기동 비용이 파싱보다 커서 직렬 처리
+        for filepath in track(files_to_parse, description="Parsing files..."):
+            try:
+                collect_parsed(filepath, load_chunks_cached(parser, filepath, parse_hashes[filepath], full_reindex))
+            except Exception as e:
+                console.print(f"[red]⚠️ Parse failed ({filepath}): {e}[/red]")
+    else:
+        workers = min(PARSE_WORKERS, len(files_to_parse))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker) as executor:
+            # 파일 여러 개를 한 번에 워커로 보내 IPC 왕복 비용을 분산
+            chunksize = max(1, len(files_to_parse) // (workers * 4))
+            results = executor.map(
+                _parse_one,
+                files_to_parse,
+                [parse_hashes[fp] for fp in files_to_parse],
+                repeat(full_reindex),
+                chunksize=chunksize,
+            )
+            for filepath, chunks, error in track(results, total=len(files_to_parse), description="Parsing files..."):
+                if error:
+                    console.print(f"[red]⚠️ Parse worker failed ({filepath}): {error}[/red]")
+                    continue
+                collect_parsed(filepath, chunks)
+
+    # 결과는 원래 파일 순서대로 합쳐 중복 제거(마지막 우선) 결과를 결정적으로 유지
+    for filepath in files_to_process:
+        chunks_to_upsert.extend(parsed_by_file.get(filepath, []))
     
     cs_chunks = [c for c in chunks_to_upsert if str(c.filepath).endswith('.cs')]
     if len(cs_chunks) == 0:
@@ -170,12 +464,20 @@ def main():
     console.print("\n[bold cyan]🚀 Phase 2-2: Generating ALL Summaries in Parallel...[/bold cyan]")
     parser.enrich_summaries_in_batch(chunks_to_upsert, max_workers=10)
 
-    # 그래프 빌더에 청크 등록
+    # 그래프 빌더에 변경 청크 등록 (그래프 전용 청크보다 나중에 등록되어 이름 충돌 시 우선)
     for chunk in chunks_to_upsert:
         graph_builder.add_chunk(chunk)
 
     console.print(f"   > Total {len(chunks_to_upsert)} chunks generated (files + folders).")
 
+    # 3. 삭제/변경된 파일의 기존 청크 일괄 정리 (파일별 왕복 대신 단일 DELETE)
+    stale_filepaths = [
+        parser._normalize_filepath(root_prefix + rel_path) for rel_path in deleted_files
+    ] + [parser._normalize_filepath(filepath) for filepath in files_to_process]
+    if stale_filepaths:
+        console.print(f"\n[bold red]🧹 Removing stale chunks of {len(stale_filepaths)} files...[/bold red]")
+        db.delete_by_filepaths(stale_filepaths)
+
     # 4. 벡터 DB 업서트
     if chunks_to_upsert:
             console.print("\n[bold green]💾 Phase 3: Upserting to PostgreSQL (pgvector)...[/bold green]")
@@ -190,15 +492,54 @@ def main():
                 if c.type == "view" or c.name.endswith(".xaml"):
                     pass # 디버그 로그 제거 (너무 많아질 수 있으므로)
             
-            db.upsert_chunks(deduped_chunks)
+            # 전체 재인덱싱 / 빈 테이블: HNSW 인덱스 갱신 비용을 적재 후 단일 빌드로 대체
+            # 증분 대량 변경: 검색 중인 서버가 전체 스캔으로 떨어지지 않도록 기존 인덱스를 유지한 채 적재하고,
+            # 적재 후 CONCURRENTLY로 새 인덱스를 만들어 교체 (재구축 실패는 예외로 인제스트 실패 처리)
+            existing_chunks = db.count_chunks()
+            fresh_load = full_reindex or existing_chunks == 0
+            bulk_load = not fresh_load and len(deduped_chunks) >= BULK_LOAD_RATIO * max(1, existing_chunks)
+            if fresh_load:
+                db.drop_vector_index()
+            try:
+                db.upsert_chunks(deduped_chunks)
+            finally:
+                if fresh_load:
+                    db.build_vector_index()
+            if bulk_load:
+                db.rebuild_vector_index_concurrently()
 
     # 5. 그래프 DB 동기화
     if chunks_to_upsert:
         console.print("\n[bold magenta]🕸️  Phase 4: Syncing Call Graph (call_edges)...[/bold magenta]")
-        graph_builder.build_call_graph(db=db)
-
-    # 6. 상태 저장
+        call_graph = graph_builder.build_call_graph()
+
+        # 변경 없는 청크끼리의 엣지는 이미 저장되어 있음 → 변경 청크가 한쪽 끝인 엣지만 기록
+        changed_qns = {c.qualified_name for c in chunks_to_upsert}
+        touched_edges = {}
+        for caller, callees in call_graph.edges.items():
+            if caller in changed_qns:
+                touched_edges[caller] = callees
+            else:
+                new_callees = [callee for callee in callees if callee in changed_qns]
+                if new_callees:
+                    touched_edges[caller] = new_callees
+        db.save_call_edges(touched_edges)
+
+    # 6. BM25 인덱스 미리 구축 → 검색 서버 시작 시 재토큰화 없이 디스크 캐시에서 로드
+    console.print("\n[bold cyan]📚 Phase 5: Building BM25 Index Cache...[/bold cyan]")
+    from src.search_engine import load_bm25_index
+    load_bm25_index(db, rebuild=True)
+
+    # 7. 상태 저장 + 현재 파일 버전에 해당하지 않는 청크 캐시 정리
+    current_state.update(retained_state)
     save_state(current_state)
+    pruned = prune_chunk_cache({
+        str(_chunk_cache_path(root_prefix + rel_path, entry["hash"]))
+        for rel_path, entry in current_state.items()
+        if entry["hash"]
+    })
+    if pruned:
+        console.print(f"[dim]🧹 Pruned {pruned} stale chunk cache files.[/dim]")
     console.print("\n[bold blue]✨ Ingest Complete![/bold blue]")
 
 if __name__ == "__main__":
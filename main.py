@@ -5,7 +5,10 @@ from rich.table import Table
 from rich import box
 from rich.progress import Progress, SpinnerColumn, TextColumn
 import re
-import json
+import orjson
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from src.database import VectorStore
 from src.llm import LocalLLM
@@ -15,6 +18,100 @@ from src import prompts
 
 console = Console()
 
+# 동일 질문 재입력 시 라우터 LLM 호출을 건너뛰기 위한 LRU 캐시 ((model, query) -> query_info)
+ROUTER_CACHE_SIZE = 512
+_router_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+TRACEBACK_BLOCK_RE = re.compile(r'(Traceback.*?)(?:\n\n|\Z)', re.DOTALL)
+PY_TRACEBACK_FILE_RE = re.compile(r'File "([^"]+)"')
+CS_TRACEBACK_FILE_RE = re.compile(r'in ([^:]+\.cs):line')
+
+# 라우터 프롬프트는 매 호출 동일 → 모듈 상수로 두어 재생성 비용 제거 (고정 prefix라 백엔드 KV 캐시 재사용에도 유리)
+ROUTER_PROMPT = """
+당신은 사용자의 질문을 분석하여 JSON 형식으로 분류하는 'Router' AI입니다.
+사용자의 질문을 분석해서 아래 분류 유형 중 하나로 분류하고 중요 정보를 추출하세요.
+
+[분류 유형]
+1. bug: 에러 수정, 오류 찾기, 디버깅 요청 (예: "이거 왜 안돼?", "NullReferenceException 에러")
+2. flow: 코드의 실행 흐름, 동작 원리, 순서 설명 요청 (예: "이게 어떻게 돌아가는거야?", "버튼 클릭하면 뭐가 실행돼?")
+3. search: 특정 기능/파일 찾기, 존재 여부 확인 (예: "로그인 기능 어디있어?", "User 클래스 찾아줘")
+4. mvvm: MVVM 패턴 관련 질문 (예: "ViewModel이랑 View 어떻게 연결돼?", "바인딩 확인해줘")
+5. general: 그 외 일반적인 코딩 질문
+
+[언어 감지]
+- Python: .py 파일, snake_case 함수명, import 구문
+- C#: .cs 파일, PascalCase 메서드명, namespace, using 구문
+- XAML: .xaml 파일, Binding, DataContext
+
+[출력 형식 (JSON)]
+{
+    "type": "유형(bug, flow, search, mvvm, general 중 택1)",
+    "filenames": ["언급된_파일명.py", "파일명.cs", "파일명.xaml"],
+    "target_name": "언급된_함수_또는_클래스명(없으면 null)",
+    "keywords": ["검색용_핵심키워드1", "키워드2"],
+    "language": "주요_언어(python, csharp, xaml, mixed 중 택1)"
+}
+
+반드시 JSON 형식만 출력하세요. 설명은 필요 없습니다.
+"""
+
+# 라우터 출력 스키마 (grammar-constrained decoding으로 JSON 외 텍스트 생성을 원천 차단)
+ROUTER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": ["bug", "flow", "search", "mvvm", "general"]},
+        "filenames": {"type": "array", "items": {"type": "string"}},
+        "target_name": {"type": ["string", "null"]},
+        "keywords": {"type": "array", "items": {"type": "string"}},
+        "language": {"type": "string", "enum": ["python", "csharp", "xaml", "mixed"]},
+    },
+    "required": ["type", "filenames", "target_name", "keywords", "language"],
+}
+
+
+def _read_first_json_object(token_stream) -> str:
+    """
+    토큰 스트림에서 첫 번째 JSON 객체가 완성될 때까지만 읽고 스트림을 닫습니다.
+    (중괄호 깊이 추적, 문자열 내부의 중괄호는 무시)
+    """
+    buffer = ""
+    start = -1
+    depth = 0
+    in_string = False
+    escaped = False
+
+    try:
+        for token in token_stream:
+            offset = len(buffer)
+            buffer += token
+            for i in range(offset, len(buffer)):
+                ch = buffer[i]
+                if start == -1:
+                    if ch == "{":
+                        start, depth = i, 1
+                    continue
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif ch == "\\":
+                        escaped = True
+                    elif ch == '"':
+                        in_string = False
+                elif ch == '"':
+                    in_string = True
+                elif ch == "{":
+                    depth += 1
+                elif ch == "}":
+                    depth -= 1
+                    if depth == 0:
+                        return buffer[start:i + 1]
+    finally:
+        # 제너레이터를 닫으면 HTTP 스트림이 끊겨 백엔드 생성도 중단됨
+        if hasattr(token_stream, "close"):
+            token_stream.close()
+
+    return buffer[start:] if start != -1 else buffer
+
 
 # ===================================================================
 # 🔍 Query Analysis (질문 유형 자동 감지 - Multi-language)
@@ -24,41 +121,20 @@ def detect_query_type(query: str, llm) -> dict:
     """
     LLM을 사용하여 질문의 의도를 동적으로 파악 (Python + C# + XAML)
     """
-    
-    router_prompt = """
-    당신은 사용자의 질문을 분석하여 JSON 형식으로 분류하는 'Router' AI입니다.
-    사용자의 질문을 분석해서 아래 분류 유형 중 하나로 분류하고 중요 정보를 추출하세요.
-
-    [분류 유형]
-    1. bug: 에러 수정, 오류 찾기, 디버깅 요청 (예: "이거 왜 안돼?", "NullReferenceException 에러")
-    2. flow: 코드의 실행 흐름, 동작 원리, 순서 설명 요청 (예: "이게 어떻게 돌아가는거야?", "버튼 클릭하면 뭐가 실행돼?")
-    3. search: 특정 기능/파일 찾기, 존재 여부 확인 (예: "로그인 기능 어디있어?", "User 클래스 찾아줘")
-    4. mvvm: MVVM 패턴 관련 질문 (예: "ViewModel이랑 View 어떻게 연결돼?", "바인딩 확인해줘")
-    5. general: 그 외 일반적인 코딩 질문
-
-    [언어 감지]
-    - Python: .py 파일, snake_case 함수명, import 구문
-    - C#: .cs 파일, PascalCase 메서드명, namespace, using 구문
-    - XAML: .xaml 파일, Binding, DataContext
-
-    [출력 형식 (JSON)]
-    {
-        "type": "유형(bug, flow, search, mvvm, general 중 택1)",
-        "filenames": ["언급된_파일명.py", "파일명.cs", "파일명.xaml"],
-        "target_name": "언급된_함수_또는_클래스명(없으면 null)",
-        "keywords": ["검색용_핵심키워드1", "키워드2"],
-        "language": "주요_언어(python, csharp, xaml, mixed 중 택1)"
-    }
-    
-    반드시 JSON 형식만 출력하세요. 설명은 필요 없습니다.
-    """
+    # 공백/줄바꿈 차이만 있는 질문은 같은 키로 취급 (대소문자는 target_name 추출에 영향을 주므로 유지)
+    # 라우터 모델이 다르면 분류 결과도 달라질 수 있으므로 모델명도 키에 포함
+    cache_key = (getattr(llm, "model", None), " ".join(query.split()))
+    cached = _router_cache.get(cache_key)
+    if cached is not None:
+        _router_cache.move_to_end(cache_key)
+        return dict(cached)
 
     try:
-        response_text = llm.generate_response(router_prompt, query)
-        
-        # JSON 파싱
-        clean_json = response_text.replace("```json", "").replace("```", "").strip()
-        result = json.loads(clean_json)
+        # JSON 객체가 닫히는 즉시 스트림 중단 (뒤따르는 불필요한 토큰 생성 방지)
+        clean_json = _read_first_json_object(
+            llm.generate_response(ROUTER_PROMPT, query, response_format=ROUTER_SCHEMA)
+        )
+        result = orjson.loads(clean_json)
         
         # 필수 필드 안전장치
         if 'filenames' not in result: result['filenames'] = []
@@ -69,7 +145,12 @@ def detect_query_type(query: str, llm) -> dict:
         result['filename'] = result['filenames'][0] if result['filenames'] else None
         result['has_traceback'] = any(keyword in query.lower() for keyword in ['traceback', 'exception', 'error at'])
         
-        return result
+        # 성공한 라우팅 결과만 캐싱 (fallback 결과는 다음 호출에서 재시도)
+        _router_cache[cache_key] = result
+        if len(_router_cache) > ROUTER_CACHE_SIZE:
+            _router_cache.popitem(last=False)
+
+        return dict(result)
 
     except Exception as e:
         console.print(f"[red]⚠️ 라우팅 실패 (기본값 사용): {e}[/red]")
@@ -89,15 +170,41 @@ def detect_query_type(query: str, llm) -> dict:
         }
 
 
+def _result_chunk(r) -> dict:
+    """검색 결과 한 건을 청크 dict로 정규화 ({'chunk': ...} 래퍼 / payload 객체 / 순수 dict 모두 처리)"""
+    payload = r.payload if hasattr(r, 'payload') else r
+    if not isinstance(payload, dict):
+        return {}
+    chunk = payload.get('chunk')
+    return chunk if isinstance(chunk, dict) else payload
+
+
+def _extend_unique(results: list, rows, seen_qns: set) -> None:
+    """검색 결과를 qualified_name 기준으로 중복 없이 results에 추가 (seen_qns는 호출 측과 공유)"""
+    for r in rows:
+        payload = r.payload if hasattr(r, 'payload') else r
+        qn = _result_chunk(payload).get('qualified_name')
+        if qn:
+            if qn in seen_qns:
+                continue
+            seen_qns.add(qn)
+        results.append(payload)
+
+
+# (query, context)만 받는 질문 유형별 프롬프트 (f-string 템플릿, 미등록 유형은 general)
+PROMPT_BUILDERS = {
+    'flow': prompts.get_flow_analysis_prompt,
+    'bug': prompts.get_bug_analysis_prompt,
+    'mvvm': prompts.get_mvvm_analysis_prompt,
+}
+
+
 def build_optimized_prompt(query: str, results: list, query_info: dict) -> str:
     """
     질문 유형에 따라 최적화된 프롬프트 생성 (언어별 처리)
     """
-    # Context 생성
-    if results and isinstance(results[0], dict) and 'filepath' in results[0] and 'chunk' not in results[0]:
-        context_str = prompts.build_file_context(results)
-    else:
-        context_str = prompts.build_smart_search_context(results)
+    # Context 생성 (파일 결과 / Smart Search 결과 모두 format_context_xml이 한 번에 정규화)
+    context_str = prompts.format_context_xml(results)
     
     # 질문 유형별 프롬프트 선택
     qtype = query_info['type']
@@ -106,25 +213,19 @@ def build_optimized_prompt(query: str, results: list, query_info: dict) -> str:
         return prompts.get_existence_check_prompt(
             query, context_str, query_info['target_name'] or "unknown"
         )
-    elif qtype == 'flow':
-        return prompts.get_flow_analysis_prompt(query, context_str)
-    elif qtype == 'bug':
-        return prompts.get_bug_analysis_prompt(query, context_str)
-    elif qtype == 'mvvm':
-        return prompts.get_mvvm_analysis_prompt(query, context_str)
     elif qtype == 'file_summary':
         return prompts.get_file_summary_prompt(
             query, context_str, query_info['filename']
         )
     elif qtype == 'error':
-        traceback_match = re.search(r'(Traceback.*?)(?:\n\n|\Z)', query, re.DOTALL)
+        traceback_match = TRACEBACK_BLOCK_RE.search(query)
         traceback = traceback_match.group(1) if traceback_match else query
         return prompts.get_error_diagnostic_prompt(
             query, context_str, traceback, 
             language=query_info.get('language', 'python')
         )
     else:
-        return prompts.get_general_prompt(query, context_str)
+        return PROMPT_BUILDERS.get(qtype, prompts.get_general_prompt)(query, context_str)
 
 
 # ===================================================================
@@ -144,7 +245,7 @@ def print_evidence_panel(results: list, query_info: dict):
     table.add_column("Function/Class", style="green", width=25)
     table.add_column("Line", justify="right", style="yellow", width=10)
 
-    for item in results[:15]:
+    for item in islice(results, 15):
         if isinstance(item, dict) and 'chunk' in item:
             chunk = item['chunk']
             table.add_row(
@@ -184,15 +285,21 @@ def main():
     ) as progress:
         task = progress.add_task("[cyan]Initializing system...", total=None)
         
-        db = VectorStore()
-        llm = LocalLLM()
-        graph_store = GraphStore()
+        # 임베딩 모델 로딩 / DB 풀 생성 / 그래프 DB 접속은 서로 독립적 → 동시에 초기화
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            db_future    = executor.submit(VectorStore)
+            llm_future   = executor.submit(LocalLLM)
+            graph_future = executor.submit(GraphStore)
+            db, llm, graph_store = db_future.result(), llm_future.result(), graph_future.result()
         engine = SmartSearchEngine(db, graph_store)
         
         progress.update(task, completed=True)
     
     console.print("[green]✅ System ready[/green]\n")
 
+    # 라우팅 LLM 호출을 기다리는 동안 질의 임베딩을 미리 계산하는 백그라운드 워커
+    prefetch_executor = ThreadPoolExecutor(max_workers=1)
+
     try:
         while True:
             query = console.input("\n[bold green]질문 (exit): [/bold green]")
@@ -200,13 +307,20 @@ def main():
                 break
 
             # Step 1: 질문 유형 자동 감지
+            # 대부분의 검색 경로가 원본 질문을 벡터 검색에 쓰므로 라우팅과 임베딩 계산을 겹쳐 실행
+            prefetch = prefetch_executor.submit(db.prefetch_query_embeddings, [query])
             with console.status("[bold blue]🤔 Intent Classification...[/bold blue]"):
                 query_info = detect_query_type(query, llm)
+                prefetch.result()
                 
             console.print(f"[dim]🔎 Detected: {query_info['type'].upper()} ({query_info.get('language', 'unknown')}) - Keywords: {query_info.get('keywords', [])}[/dim]")
 
             # Step 2: 검색 전략 선택
             with console.status("[bold blue]🔍 Searching code...[/bold blue]"):
+                # 파일별 결과 병합과 Graph 확장이 함께 쓰는 qualified_name 집합
+                seen_qns = set()
+                # 결과를 조립하면서 함께 모으는 참조 파일 목록 (답변 후 결과를 다시 순회하지 않음)
+                referenced_files = set()
                 
                 # 특정 함수/메서드명이 언급된 경우
                 if query_info.get('target_name'):
@@ -221,9 +335,7 @@ def main():
                     console.print(f"[cyan]📁 Multi-target: {', '.join(query_info['filenames'])}[/cyan]")
                     results = []
                     for fname in query_info['filenames']:
-                        f_res = db.search_by_filepath(fname, top_k=20)
-                        payloads = [r.payload if hasattr(r, 'payload') else r for r in f_res]
-                        results.extend(payloads)
+                        _extend_unique(results, db.search_by_filepath(fname, top_k=20), seen_qns)
 
                 # 단일 파일 검색
                 elif query_info['filename']:
@@ -234,24 +346,24 @@ def main():
                         console.print("[red]❌ 파일을 찾을 수 없습니다.[/red]")
                         continue
                     
-                    results = [r.payload if hasattr(r, 'payload') else r for r in all_results]
-                    results = results[:50]
+                    # 앞 50건만 payload로 변환 (전체 변환 후 슬라이스하지 않음)
+                    results = [r.payload if hasattr(r, 'payload') else r for r in islice(all_results, 50)]
                     
                 # 에러 트레이스백 처리
                 elif query_info['has_traceback']:
                     # Python 트레이스백
-                    traceback_files = re.findall(r'File "([^"]+)"', query)
+                    traceback_files = PY_TRACEBACK_FILE_RE.findall(query)
                     # C# 트레이스백
-                    csharp_files = re.findall(r'in ([^:]+\.cs):line', query)
+                    csharp_files = CS_TRACEBACK_FILE_RE.findall(query)
                     
-                    all_error_files = list(set(traceback_files + csharp_files))
+                    # 트레이스백 등장 순서를 유지한 채 중복 제거 (출력/검색 순서가 매번 같도록)
+                    all_error_files = list(dict.fromkeys(traceback_files + csharp_files))
                     
                     if all_error_files:
                         console.print(f"[cyan]🚨 Error in files: {', '.join(all_error_files)}[/cyan]")
                         results = []
                         for fname in all_error_files:
-                            file_results = db.search_by_filepath(fname, top_k=50)
-                            results.extend([r.payload if hasattr(r, 'payload') else r for r in file_results])
+                            _extend_unique(results, db.search_by_filepath(fname, top_k=50), seen_qns)
                     else:
                         results = engine.search(query, top_k=5)
                 
@@ -266,38 +378,39 @@ def main():
                 else:
                     search_query = " ".join(query_info.get('keywords', [])) if query_info.get('keywords') else query
                     if len(search_query) < 5: search_query = query
-                    results = engine.search(search_query, top_k=5)
+                    results = engine.search(search_query, top_k=5, extra_queries=[query])
                 
                 # Graph 확장
                 if results:
                     expanded_results = []
-                    existing_names = set()
-                    
+                    result_qns = []
                     for r in results:
-                        if isinstance(r, dict) and 'chunk' in r:
-                            existing_names.add(r['chunk'].get('qualified_name'))
-                        elif isinstance(r, dict):
-                            existing_names.add(r.get('qualified_name'))
+                        chunk = _result_chunk(r)
+                        result_qns.append(chunk.get('qualified_name'))
+                        referenced_files.add(chunk.get('filepath'))
+                    existing_names = seen_qns
+                    existing_names.update(qn for qn in result_qns if qn)
                     
-                    for r in results[:5]:
-                        current_qn = None
-                        if isinstance(r, dict) and 'chunk' in r:
-                            current_qn = r['chunk'].get('qualified_name')
-                        
-                        if current_qn:
-                            callee_names = graph_store.get_callees(current_qn)
-                            
-                            for callee in callee_names:
-                                if callee not in existing_names:
-                                    callee_hits = db.search(callee, top_k=3)
-                                    for hit in callee_hits:
-                                        payload = hit.payload if hasattr(hit, 'payload') else hit
-                                        hit_qn = payload.get('qualified_name') or payload.get('chunk', {}).get('qualified_name')
-                                        
-                                        if hit_qn == callee:
-                                            expanded_results.append(payload)
-                                            existing_names.add(callee)
-                                            break
+                    # 상위 결과의 callee를 먼저 모두 모은 뒤 (순서 유지, 중복 제거)
+                    pending_callees = []
+                    seed_qns = [qn for qn in islice(result_qns, 5) if qn]
+                    callees_by_qn = graph_store.get_callees_batch(seed_qns)
+                    for current_qn in seed_qns:
+                        for callee in callees_by_qn.get(current_qn, []):
+                            if callee not in existing_names:
+                                existing_names.add(callee)
+                                pending_callees.append(callee)
+
+                    # callee별 벡터 검색 대신 qualified_name 정확 조회 1회로 일괄 확장
+                    if pending_callees:
+                        callee_rows = {
+                            row.get('qualified_name'): row
+                            for row in db.retrieve_by_filenames(pending_callees)
+                        }
+                        expanded_results = [
+                            callee_rows[callee] for callee in pending_callees if callee in callee_rows
+                        ]
+                        referenced_files.update(row.get('filepath') for row in expanded_results)
 
                     if expanded_results:
                         console.print(f"[dim cyan]🕸️ Graph Expanded: +{len(expanded_results)} related[/dim cyan]")
@@ -324,12 +437,8 @@ def main():
             ))
 
             # Step 6: 참조 파일 목록 출력
-            referenced_files = set()
-            for r in results:
-                if isinstance(r, dict) and 'chunk' in r:
-                    referenced_files.add(r['chunk']['filepath'])
-                elif isinstance(r, dict) and 'filepath' in r:
-                    referenced_files.add(r['filepath'])
+            referenced_files.discard(None)
+            referenced_files.discard("")
 
             console.print(f"\n[dim]📚 Referenced Files ({len(referenced_files)}):[/dim]")
             for f in sorted(referenced_files):
@@ -339,6 +448,7 @@ def main():
         console.print("\n[yellow]Interrupted by user[/yellow]")
     
     finally:
+        prefetch_executor.shutdown(wait=False)
         graph_store.close()
         console.print("\n[dim]👋 Goodbye![/dim]")
 
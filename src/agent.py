@@ -212,14 +212,10 @@ class CodebaseAgent:
 
     def _tool_get_code_snippet(self, qualified_name: str):
         try:
-            results = self.db.client.scroll(
-                collection_name=self.db.collection,
-                scroll_filter={"must": [{"key": "qualified_name", "match": {"value": qualified_name}}]},
-                limit=1, with_payload=True, with_vectors=False,
-            )
-            points = results[0] if results else []
-            if points:
-                chunk = points[0].payload
+            # VectorStore의 공유 커넥션 풀로 qualified_name 정확 조회 (별도 클라이언트/스크롤 없음)
+            rows = self.db.retrieve_by_filenames([qualified_name])
+            if rows:
+                chunk = rows[0]
                 content = chunk.get("content", "")
                 fp = chunk.get("filepath", "")
                 ln = chunk.get("start_line", "")
@@ -3,109 +3,120 @@
 """
 
 from tree_sitter_languages import get_language, get_parser
+from loguru import logger
 import re
 
+# Python용 Tree-sitter 쿼리
+CALL_QUERY_SRC = """
+    (call
+        function: [
+            (identifier) @func_name
+            (attribute) @method_name
+        ]
+    )
+"""
+
+IMPORT_QUERY_SRC = """
+    (import_statement
+        name: (dotted_name) @import_name
+    )
+    (import_from_statement
+        module_name: (dotted_name) @module_name
+    )
+"""
+
+_FUNC_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_.]*')
+
+_PYTHON_KEYWORDS = frozenset({
+    'False', 'None', 'True', 'and', 'as', 'assert', 'async', 'await',
+    'break', 'class', 'continue', 'def', 'del', 'elif', 'else', 'except',
+    'finally', 'for', 'from', 'global', 'if', 'import', 'in', 'is',
+    'lambda', 'nonlocal', 'not', 'or', 'pass', 'raise', 'return',
+    'try', 'while', 'with', 'yield'
+})
+
+# 언어별 (language, parser, call_query, import_query) → 인스턴스마다 쿼리를 다시 컴파일하지 않도록 프로세스 단위 캐시
+_LANG_CACHE: dict[str, tuple] = {}
+
+
+def _load_language(language: str) -> tuple:
+    cached = _LANG_CACHE.get(language)
+    if cached is None:
+        lang = get_language(language)
+        cached = (
+            lang,
+            get_parser(language),
+            lang.query(CALL_QUERY_SRC),
+            lang.query(IMPORT_QUERY_SRC),
+        )
+        _LANG_CACHE[language] = cached
+    return cached
+
+
 class CallExtractor:
     def __init__(self, language: str = "python"):
-        self.language = get_language(language)
-        self.parser = get_parser(language)
-
-        # Python용 Tree-sitter 쿼리
-        self.call_query = self.language.query("""
-            (call
-                function: [
-                    (identifier) @func_name
-                    (attribute) @method_name
-                ]
-            )
-        """)
-
-        self.import_query = self.language.query("""
-            (import_statement
-                name: (dotted_name) @import_name
-            )
-            (import_from_statement
-                module_name: (dotted_name) @module_name
-            )
-        """)
+        self.language, self.parser, self.call_query, self.import_query = _load_language(language)
 
     def _is_valid_function_name(self, name: str) -> bool:
         """함수명이 유효한지 검증"""
-        if not name or not isinstance(name, str):
+        # tree-sitter 캡처 구간을 디코딩한 str만 들어오므로 타입/공백 검사 없이
+        # 대부분의 정상 식별자가 통과하는 싼 검사부터: 길이 → 첫 글자 → 예약어 → 정규식
+        n = len(name)
+        if n < 2 or n > 50:
             return False
         
-        name = name.strip()
-        
-        # 빈 문자열
-        if not name:
+        first = name[0]
+        if not (first.isalpha() or first == '_'):
             return False
         
-        # 길이 제한 (일반적인 함수명 길이)
-        if len(name) < 2 or len(name) > 50:
+        # Python 예약어 제외
+        if name in _PYTHON_KEYWORDS:
             return False
         
         # Python 함수명 규칙: 영문자, 숫자, 언더스코어, 점(모듈 참조)만 허용
-        # 단, 첫 글자는 숫자 불가
-        if not re.match(r'^[a-zA-Z_][a-zA-Z0-9_.]*$', name):
-            return False
-        
-        # 특수문자가 포함된 코드 조각 제거
-        invalid_chars = [' ', '=', '#', '<', '>', '(', ')', '[', ']', '{', '}', ':', ',', ';', '"', "'", '`', '\\', '/', '|', '&', '*', '+', '-', '%', '!', '?', '@', '$', '^']
-        if any(char in name for char in invalid_chars):
-            return False
-        
-        # 숫자로만 이루어진 경우
-        if name.isdigit():
+        # (허용 문자 집합 밖의 특수문자/공백/비 ASCII 문자도 여기서 함께 걸러짐)
+        if _FUNC_NAME_RE.fullmatch(name) is None:
             return False
         
         # 언더스코어나 점으로만 이루어진 경우
-        if all(c in ['_', '.'] for c in name):
-            return False
-        
-        # Python 예약어 제외 (선택사항)
-        python_keywords = {
-            'False', 'None', 'True', 'and', 'as', 'assert', 'async', 'await',
-            'break', 'class', 'continue', 'def', 'del', 'elif', 'else', 'except',
-            'finally', 'for', 'from', 'global', 'if', 'import', 'in', 'is',
-            'lambda', 'nonlocal', 'not', 'or', 'pass', 'raise', 'return',
-            'try', 'while', 'with', 'yield'
-        }
-        if name in python_keywords:
-            return False
-        
-        return True
+        return bool(name.strip('_.'))
 
-    def extract_calls(self, code: str) -> list[str]:
-        """코드에서 호출하는 모든 함수 추출"""
-        try:
-            tree = self.parser.parse(bytes(code, "utf8"))
-            captures = self.call_query.captures(tree.root_node)
+    def _call_names(self, node, src: bytes) -> list[str]:
+        # 바이트 오프셋은 바이트 소스에서 잘라야 비 ASCII(한글 주석 등)가 섞여도 정확함
+        # 같은 이름은 한 번만 검증, dict.fromkeys로 등장 순서를 유지한 채 중복 제거
+        names = dict.fromkeys(src[n.start_byte:n.end_byte] for n, tag in self.call_query.captures(node))
+        return [
+            func_name
+            for func_name in (name.decode("utf-8", "replace") for name in names)
+            if self._is_valid_function_name(func_name)
+        ]
 
-            calls = []
-            for node, tag in captures:
-                func_name = code[node.start_byte:node.end_byte]
-                
+    def _import_names(self, node, src: bytes) -> list[str]:
+        names = dict.fromkeys(src[n.start_byte:n.end_byte] for n, tag in self.import_query.captures(node))
+        return [name.decode("utf-8", "replace") for name in names]
 
-                if self._is_valid_function_name(func_name):
-                    calls.append(func_name)
+    def extract_calls_from_node(self, node, src: bytes) -> list[str]:
+        """이미 파싱된 파일 트리의 노드에서 바로 호출 추출 (재파싱 없음)"""
+        try:
+            return self._call_names(node, src)
+        except Exception as e:
+            logger.warning("⚠️ Call extraction error: {}", e)
+            return []
 
-            return list(set(calls))  # 중복 제거
+    def extract_calls(self, code: str) -> list[str]:
+        """코드에서 호출하는 모든 함수 추출"""
+        try:
+            src = code.encode("utf-8")
+            return self._call_names(self.parser.parse(src).root_node, src)
         except Exception as e:
-            print(f"⚠️ Call extraction error: {e}")
+            logger.warning("⚠️ Call extraction error: {}", e)
             return []
 
     def extract_imports(self, code: str) -> list[str]:
         """import 문 추출"""
         try:
-            tree = self.parser.parse(bytes(code, "utf8"))
-            captures = self.import_query.captures(tree.root_node)
-
-            imports = []
-            for node, tag in captures:
-                import_name = code[node.start_byte:node.end_byte]
-                imports.append(import_name)
-
-            return list(set(imports))
+            src = code.encode("utf-8")
+            return self._import_names(self.parser.parse(src).root_node, src)
         except Exception as e:
-            print(f"⚠️ Import extraction error: {e}")
+            logger.warning("⚠️ Import extraction error: {}", e)
             return []
@@ -2,23 +2,60 @@
 LLM용 컨텍스트 생성
 """
 
+import io
+
 from .models import CodeChunk
 
+# 청크 내용 외 템플릿 고정 문자열(헤더, 코드펜스, 관계 라벨)의 대략적 길이
+CONTEXT_TEMPLATE_OVERHEAD = 200
+
 
 class ContextBuilder:
+    def __init__(self):
+        # qualified_name → 관계 섹션 문자열 (청크의 calls/called_by/imports는 인제스트 이후 변하지 않음)
+        self._relations_cache: dict[str, str] = {}
+
+    def _relations_section(self, chunk: CodeChunk) -> str:
+        cached = self._relations_cache.get(chunk.qualified_name)
+        if cached is None:
+            cached = (
+                f"        - **Calls**: {', '.join(chunk.calls) if chunk.calls else 'None'}\n"
+                f"        - **Called by**: {', '.join(chunk.called_by) if chunk.called_by else 'None'}\n"
+                f"        - **Imports**: {', '.join(chunk.imports) if chunk.imports else 'None'}"
+            )
+            self._relations_cache[chunk.qualified_name] = cached
+        return cached
+
     def build_context(self, chunks: list[CodeChunk], max_tokens: int = 30000) -> str:
         """
         LLM에 전달할 컨텍스트 생성
 
         Graph-Code 방식: 관계 정보 포함
         """
-        context_parts = []
+        buf = io.StringIO()
         current_tokens = 0
 
         for chunk in chunks:
+            relations = self._relations_section(chunk)
             doc_section = f"\n**Docstring**: {chunk.docstring}" if chunk.docstring else ""
+            # 토큰 수 추정 (1 token ≈ 3~4 chars): 포맷 전에 길이만으로 계산해 잘려나갈 청크는 문자열을 만들지 않음
+            estimated_chars = (
+                CONTEXT_TEMPLATE_OVERHEAD
+                + len(chunk.content)
+                + len(chunk.qualified_name)
+                + len(chunk.filepath)
+                + len(relations)
+                + len(doc_section)
+            )
+            estimated_tokens = estimated_chars // 3
+
+            if current_tokens + estimated_tokens > max_tokens:
+                break
+
             # 함수 정보
-            func_info = f"""
+            if current_tokens:
+                buf.write("\n")
+            buf.write(f"""
 ## {chunk.qualified_name}
 **File**: `{chunk.filepath}:{chunk.start_line}`
 **Type**: {chunk.type}
@@ -29,24 +66,13 @@ class ContextBuilder:
 ```
  
 ### Relationships:
-        - **Calls**: {', '.join(chunk.calls) if chunk.calls else 'None'}
-        - **Called by**: {', '.join(chunk.called_by) if chunk.called_by else 'None'}
-        - **Imports**: {', '.join(chunk.imports) if chunk.imports else 'None'}
+{relations}
         
         ---
-        """
-
-            # 토큰 수 추정 (1 token ≈ 4 chars)
-            estimated_tokens = len(func_info) // 3
-
-            if current_tokens + estimated_tokens > max_tokens:
-                
-                break
-
-            context_parts.append(func_info)
+        """)
             current_tokens += estimated_tokens
 
-        return "\n".join(context_parts)
+        return buf.getvalue()
 
     def build_call_chain_context(self, call_chain: list[str],
                                  call_graph) -> str:
@@ -1,7 +1,14 @@
 import os
-import uuid
+import re
+import blake3
 import torch
 import gc
+import threading
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import attrgetter
 from typing import Optional
 from psycopg2 import pool
 import psycopg2.extras
@@ -14,10 +21,158 @@ load_dotenv()
 os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
 
 
+# HNSW 인덱스에 쓸 양자화 방식: "halfvec"(FP16, 2배 압축) 또는 "binary"(1비트, 32배 압축 → 더 많은 후보를 FP32로 재정렬)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "halfvec").lower()
+
+# CUDA에서 임베딩/리랭커 모델을 FP16으로 실행 (가중치·활성값 대역폭 절반, 코사인 유사도 변화는 무시할 수준)
+EMBED_FP16 = os.getenv("EMBED_FP16", "true").lower() == "true"
+
+# 임베딩/리랭커 추론 백엔드: "torch"(기본) / "onnx" / "openvino"
+# onnx는 ONNX Runtime 융합 커널 사용 → sentence-transformers>=4.1 + `pip install sentence-transformers[onnx-gpu]` 필요
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+
+# 저장 대상에서 제외할 호출명 (공백/주석 문자가 섞인 파싱 잔여물) → 문자마다 any() 대신 C 레벨 한 번 검사
+_INVALID_CALL_RE = re.compile(r"[ #]")
+
+EMBEDDING_INDEX_NAMES = {
+    "halfvec": "code_chunks_embedding_hv_idx",
+    "binary":  "code_chunks_embedding_bq_idx",
+}
+
+
+def _vector_literal(vec) -> str:
+    """임베딩 한 행을 pgvector 텍스트 리터럴('[x,y,...]')로 변환 (파라미터로 넘겨 ::vector 캐스트)"""
+    return "[" + ",".join(map(str, vec.tolist())) + "]"
+
+
+# code_chunks 업서트 (단건/배치 쓰기 공용) → 컬럼 순서는 _chunk_record와 일치해야 함
+UPSERT_CHUNKS_SQL = """
+    INSERT INTO code_chunks
+        (qualified_name, name, type, content, summary,
+         filepath, start_line, language, module_path,
+         docstring, calls, called_by, imports, embedding)
+    VALUES %s
+    ON CONFLICT (qualified_name) DO UPDATE SET
+        name        = EXCLUDED.name,
+        type        = EXCLUDED.type,
+        content     = EXCLUDED.content,
+        summary     = EXCLUDED.summary,
+        filepath    = EXCLUDED.filepath,
+        start_line  = EXCLUDED.start_line,
+        language    = EXCLUDED.language,
+        module_path = EXCLUDED.module_path,
+        docstring   = EXCLUDED.docstring,
+        calls       = EXCLUDED.calls,
+        called_by   = EXCLUDED.called_by,
+        imports     = EXCLUDED.imports,
+        embedding   = EXCLUDED.embedding
+"""
+UPSERT_CHUNKS_TEMPLATE = "(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::vector)"
+
+# 그대로 옮기는 컬럼은 attrgetter 한 번(C 레벨)으로 튜플 추출
+_PLAIN_CHUNK_COLUMNS = attrgetter(
+    "qualified_name", "name", "type", "content", "summary",
+    "filepath", "start_line", "language",
+)
+
+
+def _chunk_record(chunk: CodeChunk, vector: str) -> tuple:
+    """CodeChunk 한 개를 UPSERT_CHUNKS_SQL의 행 튜플로 변환"""
+    return (
+        *_PLAIN_CHUNK_COLUMNS(chunk),
+        chunk.module_path or "",
+        chunk.docstring or "",
+        chunk.calls or [],
+        chunk.called_by or [],
+        psycopg2.extras.Json(chunk.imports if isinstance(chunk.imports, dict) else {}),
+        vector,
+    )
+
+
+def _embedding_index_name() -> str:
+    return EMBEDDING_INDEX_NAMES.get(VECTOR_QUANTIZATION, EMBEDDING_INDEX_NAMES["halfvec"])
+
+
+def _embedding_index_ddl(dim: int, name: Optional[str] = None, concurrently: bool = False) -> str:
+    create = f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name or _embedding_index_name()}"
+    if VECTOR_QUANTIZATION == "binary":
+        return (
+            f"{create} "
+            f"ON code_chunks USING hnsw ((binary_quantize(embedding)::bit({dim})) bit_hamming_ops) "
+            "WITH (m = 32, ef_construction = 128)"
+        )
+    return (
+        f"{create} "
+        f"ON code_chunks USING hnsw ((embedding::halfvec({dim})) halfvec_cosine_ops) "
+        "WITH (m = 32, ef_construction = 128)"
+    )
+
+
+def _candidate_distance_sql(dim: int, qvec_sql: str) -> str:
+    """인덱스를 타는 후보 정렬식 (인덱스 표현식과 정확히 같아야 HNSW가 사용됨)"""
+    if VECTOR_QUANTIZATION == "binary":
+        return f"binary_quantize(embedding)::bit({dim}) <~> binary_quantize({qvec_sql}::vector)::bit({dim})"
+    return f"embedding::halfvec({dim}) <=> {qvec_sql}::halfvec({dim})"
+
+
+def _where_sql(by_language: bool, filepath_op: Optional[str]) -> str:
+    clauses = []
+    if by_language:
+        clauses.append("language = %s")
+    if filepath_op:
+        clauses.append(f"filepath {filepath_op}")
+    return ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+
+# 필터 조합(언어 유무 × 경로 연산자)별 SQL은 몇 가지뿐 → 질의마다 다시 조립하지 않고 한 번만 생성
+@lru_cache(maxsize=None)
+def _search_sql(dim: int, by_language: bool, filepath_op: Optional[str]) -> str:
+    return f"""
+        SELECT
+            id, qualified_name, name, type, content, summary, -- ✨ summary 추가
+            filepath, start_line, language, module_path,
+            docstring, calls, called_by, imports,
+            1 - (embedding <=> %s::vector) AS score
+        FROM (
+            SELECT * FROM code_chunks
+            {_where_sql(by_language, filepath_op)}
+            ORDER BY {_candidate_distance_sql(dim, "%s")}
+            LIMIT %s
+        ) cand
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s
+    """
+
+
+@lru_cache(maxsize=None)
+def _search_batch_sql(dim: int, by_language: bool, filepath_op: Optional[str]) -> str:
+    return f"""
+        SELECT q.idx, c.*
+        FROM unnest(%s::vector[]) WITH ORDINALITY AS q(qvec, idx)
+        CROSS JOIN LATERAL (
+            SELECT
+                id, qualified_name, name, type, content, summary,
+                filepath, start_line, language, module_path,
+                docstring, calls, called_by, imports,
+                1 - (embedding <=> q.qvec) AS score
+            FROM (
+                SELECT * FROM code_chunks
+                {_where_sql(by_language, filepath_op)}
+                ORDER BY {_candidate_distance_sql(dim, "q.qvec")}
+                LIMIT %s
+            ) cand
+            ORDER BY embedding <=> q.qvec
+            LIMIT %s
+        ) c
+        ORDER BY q.idx, c.score DESC
+    """
+
+
 def _build_ddl(dim: int) -> list:
     """실행 순서대로 DDL 구문 리스트를 반환합니다."""
     return [
         "CREATE EXTENSION IF NOT EXISTS vector",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
 
         (
             "CREATE TABLE IF NOT EXISTS code_chunks ("
@@ -38,16 +193,23 @@ def _build_ddl(dim: int) -> list:
             f"embedding vector({dim})"
             ")"
         ),
-        (
-           "CREATE INDEX IF NOT EXISTS code_chunks_embedding_idx "
-            "ON code_chunks USING hnsw (embedding vector_cosine_ops) "
-            "WITH (m = 32, ef_construction = 128)"
-        ),
+        # HNSW는 양자화된 사본(halfvec/binary)에 구축 → 인덱스 메모리 절감, 최종 순위는 FP32로 재계산
+        "DROP INDEX IF EXISTS code_chunks_embedding_idx",
+        *[
+            f"DROP INDEX IF EXISTS {name}"
+            for name in EMBEDDING_INDEX_NAMES.values()
+            if name != _embedding_index_name()
+        ],
+        _embedding_index_ddl(dim),
 
-        "CREATE INDEX IF NOT EXISTS code_chunks_qname_idx ON code_chunks (qualified_name)",
+        # qualified_name은 UNIQUE 제약의 인덱스로 충분 → 중복 인덱스는 쓰기/삭제 비용만 늘리므로 제거
+        "DROP INDEX IF EXISTS code_chunks_qname_idx",
         "CREATE INDEX IF NOT EXISTS code_chunks_name_idx  ON code_chunks (name)",
         "CREATE INDEX IF NOT EXISTS code_chunks_lang_idx  ON code_chunks (language)",
+        # filepath = ANY(...) 정확 일치 삭제/조회용
         "CREATE INDEX IF NOT EXISTS code_chunks_fp_idx    ON code_chunks (filepath)",
+        # filepath ILIKE '%keyword%' 조회용 (btree는 부분 문자열 매칭에 사용 불가)
+        "CREATE INDEX IF NOT EXISTS code_chunks_fp_trgm_idx ON code_chunks USING gin (filepath gin_trgm_ops)",
 
         (
             "CREATE TABLE IF NOT EXISTS call_edges ("
@@ -58,13 +220,44 @@ def _build_ddl(dim: int) -> list:
             ")"
         ),
 
-        "CREATE INDEX IF NOT EXISTS call_edges_caller_idx        ON call_edges (caller_qn)",
+        # UNIQUE (caller_qn, callee_qn) 인덱스가 caller_qn 선두 조회까지 처리
+        "DROP INDEX IF EXISTS call_edges_caller_idx",
+        "DROP INDEX IF EXISTS call_edges_caller_callee_idx",
         "CREATE INDEX IF NOT EXISTS call_edges_callee_idx        ON call_edges (callee_qn)",
-        "CREATE INDEX IF NOT EXISTS call_edges_caller_callee_idx ON call_edges (caller_qn, callee_qn)",
+
+        # 임베딩 텍스트 해시 → 벡터 (재인덱싱 시 동일 텍스트 재인코딩 방지)
+        (
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "text_hash TEXT PRIMARY KEY,"
+            f"embedding vector({dim})"
+            ")"
+        ),
     ]
 
 
 class VectorStore:
+    # 양자화 인덱스로 top_k * N 후보를 뽑은 뒤 FP32 거리로 재정렬 (1비트 양자화는 순위 오차가 커서 더 많이 뽑음)
+    # (RESCORE_OVERSAMPLING 환경 변수로 재현율/지연 균형 조정 가능)
+    RESCORE_OVERSAMPLING = int(
+        os.getenv("RESCORE_OVERSAMPLING", 8 if VECTOR_QUANTIZATION == "binary" else 2)
+    )
+    # HNSW 탐색 폭: pgvector는 ef_search(기본 40)개를 넘는 후보를 돌려주지 않으므로 후보 LIMIT 이상으로 맞춤
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+    # 최근 질의 임베딩(pgvector 리터럴 문자열) LRU 크기 → 라우팅 중 미리 계산한 임베딩을 검색에서 재사용
+    QUERY_EMBED_CACHE_SIZE = 256
+    # 인코더 내부 배치 크기 (DB 쓰기 배치 크기와 분리, sentence-transformers가 길이순 정렬 후 패딩 최소화)
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+    # 동시에 진행할 DB 쓰기 배치 수 (풀 크기 maxconn=8 안에서 검색용 커넥션 여유를 남김)
+    UPSERT_WRITERS = max(1, min(4, int(os.getenv("UPSERT_WRITERS", 2))))
+    # 적재 후 HNSW 단일 빌드 시 그래프를 메모리에 올려 병렬로 구성 (부족하면 pgvector가 느린 디스크 경로로 전환)
+    HNSW_BUILD_MEM = os.getenv("HNSW_BUILD_MEM", "1GB")
+    HNSW_BUILD_WORKERS = int(os.getenv("HNSW_BUILD_WORKERS", 4))
+    # 리랭커(ms-marco MiniLM, 최대 512토큰)에 넣기 전 본문 길이 상한 → 어차피 잘릴 토큰의 토크나이징 비용 제거
+    RERANK_MAX_CHARS = 2000
+    RERANK_BATCH_SIZE = 64
+    # upsert_chunks가 한 번에 임베딩하고 한 트랜잭션으로 쓰는 청크 수 (쓰기 배치 단위)
+    UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", 256))
+
     def __init__(self, collection_name: Optional[str] = None):
         device = "cuda" if torch.cuda.is_available() else "cpu"
         model_path = os.getenv("EMBEDDING_MODEL_PATH", "sentence-transformers/all-MiniLM-L6-v2")
@@ -72,17 +265,34 @@ class VectorStore:
         print(f"📡 Loading Embedding Model: {model_path}")
         print(f"🚀 Acceleration Device: {device.upper()}")
 
+        # torch 외 백엔드는 처음 로딩 시 ONNX/OpenVINO로 내보낸 뒤 모델 캐시에 저장되어 재사용됨
+        backend_kwargs = {} if EMBED_BACKEND == "torch" else {"backend": EMBED_BACKEND}
+        if backend_kwargs:
+            print(f"⚙️ Inference Backend: {EMBED_BACKEND}")
+
         print("⚖️ Loading Reranker Model...")
         self.reranker = CrossEncoder(
-            "cross-encoder/ms-marco-MiniLM-L-6-v2", device=device
+            "cross-encoder/ms-marco-MiniLM-L-6-v2", device=device, **backend_kwargs
         )
 
         self.embedder = SentenceTransformer(
-            model_path, device=device, trust_remote_code=True
+            model_path, device=device, trust_remote_code=True, **backend_kwargs
         )
+        if device == "cuda" and EMBED_FP16 and not backend_kwargs:
+            # CPU 경로는 FP32 유지 (CPU FP16 연산은 오히려 느림)
+            self.embedder.half()
+            self.reranker.model.half()
+            print("🪶 Embedding/Reranker models running in FP16")
+        self.embedding_model = model_path
         self.embedding_dim = self.embedder.get_sentence_embedding_dimension()
         print(f"🔍 Embedding Dimension: {self.embedding_dim}")
 
+        self._query_vec_cache: OrderedDict[str, str] = OrderedDict()
+        self._query_vec_lock = threading.Lock()
+        # fast 토크나이저는 스레드 간 공유 시 "Already borrowed"가 날 수 있음 → 동시 요청(배치 진단 등)의 추론은 직렬화
+        self._embed_lock = threading.Lock()
+        self._rerank_lock = threading.Lock()
+
         self.collection = collection_name or os.getenv("COLLECTION_NAME", "code_chunks")
         self._pool = self._create_pool()
         self._ensure_schema()
@@ -104,6 +314,41 @@ class VectorStore:
             print(f"⚠️ PostgreSQL connection failed: {e}")
             raise
 
+    def _set_ef_search(self, cur, candidate_limit: int):
+        # SET LOCAL: 현재 트랜잭션에만 적용 (풀 반환 시 롤백되어 다른 쿼리에 영향 없음)
+        cur.execute(
+            "SET LOCAL hnsw.ef_search = %s",
+            (min(1000, max(self.HNSW_EF_SEARCH, candidate_limit)),),
+        )
+
+    def _query_vec_strs(self, queries: list[str]) -> list[str]:
+        """질의 임베딩을 pgvector 리터럴로 반환 (캐시 미스만 한 번의 배치로 인코딩)"""
+        # 공백/줄바꿈 차이만 있는 질의는 같은 키로 취급하고, 정규화된 문자열을 그대로 인코딩
+        queries = [" ".join(q.split()) for q in queries]
+        with self._query_vec_lock:
+            cached = [self._query_vec_cache.get(q) for q in queries]
+        misses = list(dict.fromkeys(q for q, v in zip(queries, cached) if v is None))
+        if not misses:
+            return cached
+
+        with self._embed_lock:
+            qvecs = self.embedder.encode(misses, show_progress_bar=False, convert_to_numpy=True)
+        fresh = {q: _vector_literal(v) for q, v in zip(misses, qvecs)}
+        with self._query_vec_lock:
+            for q, vec_str in fresh.items():
+                self._query_vec_cache[q] = vec_str
+                self._query_vec_cache.move_to_end(q)
+            while len(self._query_vec_cache) > self.QUERY_EMBED_CACHE_SIZE:
+                self._query_vec_cache.popitem(last=False)
+        return [v if v is not None else fresh[q] for q, v in zip(queries, cached)]
+
+    def prefetch_query_embeddings(self, queries: list[str]):
+        """다른 작업(LLM 라우팅 등)을 기다리는 동안 질의 임베딩을 미리 계산해 캐시에 적재"""
+        try:
+            self._query_vec_strs([q for q in queries if q])
+        except Exception as e:
+            print(f"⚠️ Query embedding prefetch error: {e}")
+
     def _conn(self):
         return self._pool.getconn()
 
@@ -111,13 +356,13 @@ class VectorStore:
         self._pool.putconn(conn)
 
     def _ensure_schema(self):
-        statements = _build_ddl(self.embedding_dim)
+        # 모든 구문이 IF [NOT] EXISTS → 매 시작마다 구문별 왕복 대신 하나의 스크립트로 한 번에 전송
+        script = ";\n".join(_build_ddl(self.embedding_dim))
         conn = self._conn()
         try:
             with conn:
                 with conn.cursor() as cur:
-                    for stmt in statements:
-                        cur.execute(stmt)
+                    cur.execute(script)
             print("✅ Schema ready.")
         except Exception as e:
             print(f"⚠️ Schema init error: {e}")
@@ -130,60 +375,102 @@ class VectorStore:
         try:
             with conn:
                 with conn.cursor() as cur:
-                    cur.execute("DROP TABLE IF EXISTS call_edges CASCADE;")
-                    cur.execute("DROP TABLE IF EXISTS code_chunks CASCADE;")
-                    cur.execute("DROP TABLE IF EXISTS semantic_query_cache CASCADE;")
-            self._ensure_schema()
+                    # 삭제와 재생성을 같은 트랜잭션의 단일 왕복으로 처리
+                    cur.execute(";\n".join([
+                        "DROP TABLE IF EXISTS call_edges CASCADE",
+                        "DROP TABLE IF EXISTS code_chunks CASCADE",
+                        "DROP TABLE IF EXISTS semantic_query_cache CASCADE",
+                        *_build_ddl(self.embedding_dim),
+                    ]))
             print("✅ Tables recreated.")
         finally:
             self._release(conn)
 
+    # 대량 적재 시에는 HNSW 인덱스를 내렸다가 적재 후 한 번에 재구축하는 편이 훨씬 빠름
+    def drop_vector_index(self):
+        conn = self._conn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP INDEX IF EXISTS {_embedding_index_name()};")
+            print("⏸️ HNSW index dropped for bulk load.")
+        except Exception as e:
+            print(f"⚠️ drop_vector_index error: {e}")
+        finally:
+            self._release(conn)
+
+    def build_vector_index(self):
+        conn = self._conn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL maintenance_work_mem = %s", (self.HNSW_BUILD_MEM,))
+                    cur.execute(
+                        "SET LOCAL max_parallel_maintenance_workers = %s", (self.HNSW_BUILD_WORKERS,)
+                    )
+                    cur.execute(_embedding_index_ddl(self.embedding_dim))
+                    # 대량 적재 직후 통계가 비어 있으면 플래너가 filepath/name 인덱스 대신 전체 스캔을 고름
+                    cur.execute("ANALYZE code_chunks")
+            print("✅ HNSW index rebuilt.")
+        except Exception as e:
+            # 인덱스 없이 남지 않도록 호출자(인제스트)를 실패로 종료시킴
+            print(f"⚠️ build_vector_index error: {e}")
+            raise
+        finally:
+            self._release(conn)
+
+    def rebuild_vector_index_concurrently(self):
+        """
+        증분 대량 변경 후 HNSW 인덱스 재구축: 기존 인덱스는 검색에 계속 쓰이는 동안
+        임시 이름으로 CREATE INDEX CONCURRENTLY 후 짧은 트랜잭션에서 교체합니다.
+        """
+        name = _embedding_index_name()
+        tmp_name = f"{name}_new"
+        conn = self._conn()
+        try:
+            # CONCURRENTLY는 트랜잭션 블록 안에서 실행할 수 없음
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                # 이전 실행이 남긴 INVALID 임시 인덱스 정리
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp_name}")
+                cur.execute("SET maintenance_work_mem = %s", (self.HNSW_BUILD_MEM,))
+                cur.execute("SET max_parallel_maintenance_workers = %s", (self.HNSW_BUILD_WORKERS,))
+                try:
+                    cur.execute(_embedding_index_ddl(self.embedding_dim, name=tmp_name, concurrently=True))
+                except Exception:
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp_name}")
+                    raise
+                finally:
+                    cur.execute("RESET maintenance_work_mem")
+                    cur.execute("RESET max_parallel_maintenance_workers")
+            conn.autocommit = False
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP INDEX IF EXISTS {name}")
+                    cur.execute(f"ALTER INDEX {tmp_name} RENAME TO {name}")
+                    cur.execute("ANALYZE code_chunks")
+            print("✅ HNSW index rebuilt concurrently and swapped in.")
+        except Exception as e:
+            print(f"⚠️ rebuild_vector_index_concurrently error: {e}")
+            raise
+        finally:
+            conn.autocommit = False
+            self._release(conn)
+
     #임베딩 시 원본 코드가 아닌 요약본을 사용
     def _make_embed_text(self, chunk: CodeChunk) -> str:
         return f"Name: {chunk.name}\nType: {chunk.type}\nSummary: {chunk.summary}\nPath: {chunk.filepath}"
 
-    def _upsert_single(self, chunk: CodeChunk, vector: list) -> bool:
+    def _upsert_single(self, chunk: CodeChunk, vector: str) -> bool:
         conn = self._conn()
         try:
-            imports_json = (
-                psycopg2.extras.Json(chunk.imports)
-                if isinstance(chunk.imports, dict)
-                else psycopg2.extras.Json({})
-            )
             with conn:
                 with conn.cursor() as cur:
                     psycopg2.extras.execute_values(
                         cur,
-                        """
-                        INSERT INTO code_chunks
-                            (id, qualified_name, name, type, content, summary,
-                             filepath, start_line, language, module_path,
-                             docstring, calls, called_by, imports, embedding)
-                        VALUES %s
-                        ON CONFLICT (qualified_name) DO UPDATE SET
-                            name        = EXCLUDED.name,
-                            type        = EXCLUDED.type,
-                            content     = EXCLUDED.content,
-                            summary     = EXCLUDED.summary,
-                            filepath    = EXCLUDED.filepath,
-                            start_line  = EXCLUDED.start_line,
-                            language    = EXCLUDED.language,
-                            module_path = EXCLUDED.module_path,
-                            docstring   = EXCLUDED.docstring,
-                            calls       = EXCLUDED.calls,
-                            called_by   = EXCLUDED.called_by,
-                            imports     = EXCLUDED.imports,
-                            embedding   = EXCLUDED.embedding
-                        """,
-                        [(
-                            str(uuid.uuid4()),
-                            chunk.qualified_name, chunk.name, chunk.type,
-                            chunk.content, chunk.summary, chunk.filepath, chunk.start_line,
-                            chunk.language, chunk.module_path or "",
-                            chunk.docstring or "", chunk.calls or [],
-                            chunk.called_by or [], imports_json, vector,
-                        )],
-                        template="(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::vector)",
+                        UPSERT_CHUNKS_SQL,
+                        [_chunk_record(chunk, vector)],
+                        template=UPSERT_CHUNKS_TEMPLATE,
                     )
             return True
         except Exception as e:
@@ -192,98 +479,169 @@ class VectorStore:
         finally:
             self._release(conn)
 
-    def upsert_chunks(self, chunks: list[CodeChunk], batch_size: int = 100):
+    def _embed_hash(self, text: str) -> str:
+        # 모델이 바뀌면 벡터도 달라지므로 모델 경로를 키에 포함
+        return blake3.blake3(f"{self.embedding_model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _fetch_cached_embeddings(self, hashes: list[str]) -> list:
+        """hashes와 같은 순서로 캐시된 벡터(문자열 리터럴) 또는 None을 반환합니다."""
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT text_hash, embedding::text FROM embedding_cache WHERE text_hash = ANY(%s)",
+                    (hashes,),
+                )
+                found = dict(cur.fetchall())
+            return [found.get(h) for h in hashes]
+        except Exception as e:
+            print(f"⚠️ Embedding cache lookup error: {e}")
+            conn.rollback()
+            return [None] * len(hashes)
+        finally:
+            self._release(conn)
+
+    def _store_cached_embeddings(self, cur, entries: list[tuple]):
+        if not entries:
+            return
+        # 병렬 쓰기 트랜잭션끼리 같은 키를 서로 다른 순서로 잠가 교착되지 않도록 키 순서로 삽입
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO embedding_cache (text_hash, embedding) VALUES %s ON CONFLICT DO NOTHING",
+            sorted(entries, key=lambda e: e[0]),
+            template="(%s,%s::vector)",
+        )
+
+    def _write_batch(
+        self,
+        batch: list[CodeChunk],
+        vectors: list[str],
+        batch_num: int,
+        total_batch: int,
+        new_cache_entries: Optional[list[tuple]] = None,
+    ):
+        conn = self._conn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    # 커밋 시 WAL fsync를 기다리지 않음 (이 트랜잭션에만 적용, 인제스트는 재실행으로 복구 가능)
+                    cur.execute("SET LOCAL synchronous_commit = off")
+                    # id는 서버 기본값(gen_random_uuid())으로 생성, 충돌 시에는 기존 id 유지
+                    psycopg2.extras.execute_values(
+                        cur,
+                        UPSERT_CHUNKS_SQL,
+                        [_chunk_record(c, vec) for c, vec in zip(batch, vectors)],
+                        template=UPSERT_CHUNKS_TEMPLATE,
+                        page_size=len(batch),  # 배치 전체를 INSERT 한 문장으로 (기본 100행 분할 왕복 제거)
+                    )
+                    self._store_cached_embeddings(cur, new_cache_entries)
+            print(f"  ✔ Saved batch {batch_num}/{total_batch}")
+        finally:
+            self._release(conn)
+
+    def _warmup_allocator(self, chunks: list[CodeChunk]):
+        """
+        가장 긴 임베딩 텍스트로 최대 크기 배치를 한 번 인코딩해 CUDA 캐싱 할당자에 최대 세그먼트를 미리 확보.
+        이후 배치는 (짧은 배치든 긴 배치든) 이 세그먼트를 재사용하므로 배치 중간의 할당/단편화가 사라짐.
+        """
+        if not chunks or not torch.cuda.is_available():
+            return
+        longest = max((self._make_embed_text(c) for c in chunks), key=len)
+        try:
+            self.embedder.encode(
+                [longest] * min(len(chunks), self.EMBED_BATCH_SIZE),
+                batch_size=self.EMBED_BATCH_SIZE,
+                show_progress_bar=False,
+            )
+        except RuntimeError as e:
+            # 예열 실패는 무시 (본 루프의 OOM 대체 경로가 처리)
+            print(f"  ⚠️ Embedder warm-up skipped: {e}")
+            torch.cuda.empty_cache()
+
+    def upsert_chunks(self, chunks: list[CodeChunk], batch_size: Optional[int] = None):
+        batch_size = batch_size or self.UPSERT_BATCH_SIZE
         total = len(chunks)
         total_batch = (total + batch_size - 1) // batch_size
+        self._warmup_allocator(chunks)
+
+        # 임베딩(GPU)과 DB 쓰기(네트워크)를 겹치기 위해 쓰기는 백그라운드 스레드 UPSERT_WRITERS개에서 수행
+        # 동시에 진행 중인 쓰기는 최대 UPSERT_WRITERS개 → 메모리에 남는 배치 수가 제한됨
+        n_writers = self.UPSERT_WRITERS
 
-        for i in range(0, total, batch_size):
-            batch = chunks[i : i + batch_size]
-            batch_num = i // batch_size + 1
+        with ThreadPoolExecutor(max_workers=n_writers) as writer:
+            pending_writes = deque()
 
-            for chunk in batch:
-                chunk.calls = [
-                    c for c in chunk.calls
-                    if isinstance(c, str)
-                    and (
+            for i in range(0, total, batch_size):
+                batch = chunks[i : i + batch_size]
+                batch_num = i // batch_size + 1
 
-                        c.startswith("__vm_context__:")
-                        or (
-                            len(c) <= 200
-                            and not any(ch in c for ch in [" ", "#"])
+                for chunk in batch:
+                    chunk.calls = [
+                        c for c in chunk.calls
+                        if isinstance(c, str)
+                        and (
+                            c.startswith("__vm_context__:")
+                            or (len(c) <= 200 and _INVALID_CALL_RE.search(c) is None)
                         )
-                    )
-                ]
+                    ]
 
-            #변경된 임베딩 텍스트 적용 (원본 코드 제외, 메타데이터+요약)
-            texts = [self._make_embed_text(c) for c in batch]
-            vectors = None
+                #변경된 임베딩 텍스트 적용 (원본 코드 제외, 메타데이터+요약)
+                texts = [self._make_embed_text(c) for c in batch]
 
-            try:
-                vectors = self.embedder.encode(
-                    texts, batch_size=32, show_progress_bar=False
-                ).tolist()
+                # 임베딩 텍스트가 이전과 동일한 청크는 캐시된 벡터 재사용 (인코딩 생략)
+                # 벡터는 pgvector 텍스트 리터럴로 다룸: 캐시 적중분은 DB에서 읽은 문자열을 파싱 없이 그대로 다시 씀
+                hashes   = [self._embed_hash(t) for t in texts]
+                cached   = self._fetch_cached_embeddings(hashes)
+                vectors  = list(cached)
+                miss_idx = [idx for idx, v in enumerate(cached) if v is None]
+                if len(miss_idx) < len(batch):
+                    print(f"  ♻️ Batch {batch_num}: {len(batch) - len(miss_idx)} embeddings reused from cache")
+
+                if miss_idx:
+                    try:
+                        miss_vecs = self.embedder.encode(
+                            [texts[idx] for idx in miss_idx],
+                            batch_size=self.EMBED_BATCH_SIZE,
+                            show_progress_bar=False,
+                            convert_to_numpy=True,
+                        )
+                        # 새 벡터는 한 번만 직렬화해 code_chunks와 embedding_cache 쓰기에 함께 사용
+                        for idx, vec in zip(miss_idx, miss_vecs):
+                            vectors[idx] = _vector_literal(vec)
+                    except RuntimeError as e:
+                        if "out of memory" not in str(e).lower():
+                            raise
+                        print(f"  ⚠️ Batch {batch_num} OOM → retrying one-by-one...")
+                        torch.cuda.empty_cache()
+                        gc.collect()
+                        for idx, chunk in enumerate(batch):
+                            try:
+                                vec = cached[idx]
+                                if vec is None:
+                                    torch.cuda.empty_cache()
+                                    vec = _vector_literal(self.embedder.encode(
+                                        [texts[idx]], batch_size=1, show_progress_bar=False,
+                                    )[0])
+                                self._upsert_single(chunk, vec)
+                            except Exception as oom2:
+                                print(f"  ✗ [{chunk.name}] failed: {oom2}")
+                        continue
+
+                new_cache_entries = [(hashes[idx], vectors[idx]) for idx in miss_idx]
+
+                if len(pending_writes) >= n_writers:
+                    pending_writes.popleft().result()
+                pending_writes.append(writer.submit(
+                    self._write_batch, batch, vectors, batch_num, total_batch, new_cache_entries
+                ))
+
+            while pending_writes:
+                pending_writes.popleft().result()
+
+        # 배치마다 비우면 캐싱 할당자 재사용이 깨지므로 작업이 끝난 뒤 한 번만 반환
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
 
-                conn = self._conn()
-                try:
-                    with conn:
-                        with conn.cursor() as cur:
-                            records = []
-                            for idx, chunk in enumerate(batch):
-                                imports_json = (
-                                    psycopg2.extras.Json(chunk.imports)
-                                    if isinstance(chunk.imports, dict)
-                                    else psycopg2.extras.Json({})
-                                )
-                                records.append((
-                                    str(uuid.uuid4()), chunk.qualified_name, chunk.name, chunk.type, 
-                                    chunk.content, chunk.summary, chunk.filepath, chunk.start_line, 
-                                    chunk.language, chunk.module_path or "", chunk.docstring or "", 
-                                    chunk.calls or [], chunk.called_by or [], imports_json, vectors[idx],
-                                ))
-                            psycopg2.extras.execute_values(
-                                cur,
-                                """
-                                INSERT INTO code_chunks
-                                    (id, qualified_name, name, type, content, summary,
-                                     filepath, start_line, language, module_path,
-                                     docstring, calls, called_by, imports, embedding)
-                                VALUES %s
-                                ON CONFLICT (qualified_name) DO UPDATE SET
-                                    name        = EXCLUDED.name,
-                                    type        = EXCLUDED.type,
-                                    content     = EXCLUDED.content,
-                                    summary     = EXCLUDED.summary,
-                                    filepath    = EXCLUDED.filepath,
-                                    start_line  = EXCLUDED.start_line,
-                                    language    = EXCLUDED.language,
-                                    module_path = EXCLUDED.module_path,
-                                    docstring   = EXCLUDED.docstring,
-                                    calls       = EXCLUDED.calls,
-                                    called_by   = EXCLUDED.called_by,
-                                    imports     = EXCLUDED.imports,
-                                    embedding   = EXCLUDED.embedding
-                                """,
-                                records,
-                                template="(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s::vector)",
-                            )
-                    print(f"  ✔ Saved batch {batch_num}/{total_batch}")
-                finally:
-                    self._release(conn)
-
-            except RuntimeError as e:
-                if "out of memory" in str(e).lower():
-                    print(f"  ⚠️ Batch {batch_num} OOM → retrying one-by-one...")
-                    torch.cuda.empty_cache()
-                    gc.collect()
-                    for chunk in batch:
-                        try:
-                            torch.cuda.empty_cache()
-                            vec = self.embedder.encode(
-                                [self._make_embed_text(chunk)], batch_size=1, show_progress_bar=False,
-                            ).tolist()[0]
-                            self._upsert_single(chunk, vec)
-                        except Exception as oom2:
-                            print(f"  ✗ [{chunk.name}] failed: {oom2}")
     # 벡터 검색 
     def search(
         self,
@@ -293,35 +651,24 @@ class VectorStore:
         filepath_keyword: Optional[str] = None,
     ) -> list[dict]:
         """코사인 유사도 기반 벡터 검색. dict 리스트를 반환합니다."""
-        qvec    = self.embedder.encode(query).tolist()
-        vec_str = "[" + ",".join(map(str, qvec)) + "]"
+        vec_str = self._query_vec_strs([query])[0]
 
-        where_clauses = []
-        params        = []
+        params = []
         if language:
-            where_clauses.append("language = %s")
             params.append(language)
         if filepath_keyword:
-            where_clauses.append("filepath ILIKE %s")
             params.append(f"%{filepath_keyword}%")
 
-        where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
-        sql = f"""
-            SELECT
-                id, qualified_name, name, type, content, summary, -- ✨ summary 추가
-                filepath, start_line, language, module_path,
-                docstring, calls, called_by, imports,
-                1 - (embedding <=> %s::vector) AS score
-            FROM code_chunks
-            {where_sql}
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s
-        """
-        params = [vec_str] + params + [vec_str, top_k]
+        sql = _search_sql(self.embedding_dim, bool(language), "ILIKE %s" if filepath_keyword else None)
+        params = (
+            [vec_str] + params
+            + [vec_str, top_k * self.RESCORE_OVERSAMPLING, vec_str, top_k]
+        )
 
         conn = self._conn()
         try:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                self._set_ef_search(cur, top_k * self.RESCORE_OVERSAMPLING)
                 cur.execute(sql, params)
                 return [dict(r) for r in cur.fetchall()]
         except Exception as e:
@@ -330,6 +677,49 @@ class VectorStore:
         finally:
             self._release(conn)
 
+    def search_batch(
+        self,
+        queries: list[str],
+        top_k: int = 5,
+        language: Optional[str] = None,
+        filepath_keywords: Optional[list[str]] = None,
+    ) -> list[list[dict]]:
+        """
+        여러 쿼리를 한 번의 임베딩 배치 + 한 번의 SQL 왕복으로 검색합니다.
+        반환값은 queries와 같은 순서의 결과 리스트입니다.
+        """
+        if not queries:
+            return []
+
+        vec_strs = self._query_vec_strs(queries)
+
+        params = []
+        if language:
+            params.append(language)
+        if filepath_keywords:
+            params.append([f"%{kw}%" for kw in filepath_keywords])
+
+        sql = _search_batch_sql(
+            self.embedding_dim, bool(language), "ILIKE ANY(%s)" if filepath_keywords else None
+        )
+        params = [vec_strs] + params + [top_k * self.RESCORE_OVERSAMPLING, top_k]
+
+        grouped: list[list[dict]] = [[] for _ in queries]
+        conn = self._conn()
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                self._set_ef_search(cur, top_k * self.RESCORE_OVERSAMPLING)
+                cur.execute(sql, params)
+                for r in cur.fetchall():
+                    row = dict(r)
+                    grouped[row.pop("idx") - 1].append(row)
+            return grouped
+        except Exception as e:
+            print(f"⚠️ Batch vector search error: {e}")
+            return grouped
+        finally:
+            self._release(conn)
+
     # 파일 경로 검색
     def search_by_filepath(self, filepath_keyword: str, top_k: int = 10) -> list[dict]:
         conn = self._conn()
@@ -379,10 +769,15 @@ class VectorStore:
             self._release(conn)
 
     #전체 청크 스크롤
-    def scroll_all(self) -> list[dict]:
+    def iter_all(self, page_size: int = 2048):
+        """
+        전체 청크를 서버 측 커서로 page_size 행씩 스트리밍 (결과 전체를 클라이언트 메모리에 한 번에 올리지 않음)
+        """
         conn = self._conn()
         try:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            # 이름 있는 커서 = 서버 측 커서 → 순회하면서 itersize 단위로 다음 페이지를 가져옴
+            with conn.cursor(name="code_chunks_scan", cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.itersize = page_size
                 cur.execute(
                     """
                     SELECT id, qualified_name, name, type, content,
@@ -392,21 +787,39 @@ class VectorStore:
                     ORDER BY qualified_name
                     """
                 )
-                return [dict(r) for r in cur.fetchall()]
+                for r in cur:
+                    yield dict(r)
         except Exception as e:
             print(f"⚠️ Scroll error: {e}")
-            return []
         finally:
             self._release(conn)
 
+    def scroll_all(self) -> list[dict]:
+        return list(self.iter_all())
+
     # reranking
     def rerank(self, query: str, results: list[dict], top_k: int = 10) -> list[dict]:
         if not results:
             return []
-        passages = [r.get("content", "") for r in results]
-        scores   = self.reranker.predict([[query, p] for p in passages])
-        ranked   = sorted(zip(results, scores), key=lambda x: x[1], reverse=True)
-        return [item[0] for item in ranked[:top_k]]
+        passages = [(r.get("content") or "")[: self.RERANK_MAX_CHARS] for r in results]
+        # 길이순으로 정렬해 배치마다 패딩을 최소화한 뒤 점수를 원래 순서로 되돌림
+        order = sorted(range(len(passages)), key=lambda i: len(passages[i]))
+        with self._rerank_lock:
+            sorted_scores = self.reranker.predict(
+                [[query, passages[i]] for i in order],
+                batch_size=self.RERANK_BATCH_SIZE,
+                show_progress_bar=False,
+            )
+        scores = np.empty(len(passages), dtype=np.float32)
+        scores[order] = sorted_scores
+
+        # 전체 정렬 대신 상위 top_k만 O(n) 선택 후 그 안에서만 정렬
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        top_idx = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_idx = top_idx[np.argsort(-scores[top_idx], kind="stable")]
+        return [results[i] for i in top_idx]
 
     # call graph
     def save_call_edges(self, edges: dict[str, list[str]]):
@@ -538,6 +951,23 @@ class VectorStore:
             flows.append(f"[Callee|depth={item['depth']}] {item['qn']}")
         return flows
 
+    def corpus_fingerprint(self) -> Optional[str]:
+        """
+        code_chunks 변경 감지용 지문 (행 수 + 최신 행의 트랜잭션 ID).
+        INSERT/UPDATE는 xmin을, DELETE는 행 수를 바꾸므로 본문을 읽지 않고 BM25 캐시 유효성을 판단합니다.
+        """
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*), MAX(xmin::text::bigint) FROM code_chunks;")
+                count, max_xmin = cur.fetchone()
+                return f"{count}:{max_xmin}"
+        except Exception as e:
+            print(f"⚠️ corpus_fingerprint error: {e}")
+            return None
+        finally:
+            self._release(conn)
+
     def count_chunks(self) -> int:
         """code_chunks 테이블의 전체 행 수를 반환합니다 (BM25 갱신 감지용)."""
         conn = self._conn()
@@ -554,7 +984,7 @@ class VectorStore:
     def search_by_exact_names(self, names: list[str]) -> list[dict]:
         """
         name 또는 qualified_name이 정확히 일치하는 청크를 SQL INDEX로 조회합니다.
-        (code_chunks_name_idx, code_chunks_qname_idx 활용)
+        (code_chunks_name_idx, qualified_name UNIQUE 제약 인덱스 활용)
         기존 Python 루프 순회(_get_exact_function_chunks)를 대체합니다.
         """
         if not names:
@@ -599,6 +1029,45 @@ class VectorStore:
         finally:
             self._release(conn)
 
+    def delete_by_filepaths(self, filepaths: list[str], batch_size: int = 500) -> int:
+        """filepath가 정확히 일치하는 청크와 그 청크가 caller/callee인 call_edges를 삭제합니다 (배치당 쿼리 1회)."""
+        if not filepaths:
+            return 0
+        filepaths = list(dict.fromkeys(filepaths))
+        deleted   = 0
+        conn = self._conn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    # 청크 삭제 결과(RETURNING)로 바로 call_edges를 지워 code_chunks를 한 번만 스캔
+                    # 삭제된 청크를 가리키는 엣지(callee 쪽)도 지워야 재귀 조회에 유령 노드가 남지 않음
+                    # (아직 유효한 변경 안 된 caller → 변경 청크 엣지는 인제스트 Phase 4에서 다시 기록)
+                    # ANY(ARRAY(...)): caller/callee 양쪽 인덱스를 BitmapOr로 사용
+                    for i in range(0, len(filepaths), batch_size):
+                        cur.execute(
+                            """
+                            WITH gone AS (
+                                DELETE FROM code_chunks
+                                WHERE filepath = ANY(%s)
+                                RETURNING qualified_name
+                            ), gone_edges AS (
+                                DELETE FROM call_edges
+                                WHERE caller_qn = ANY(ARRAY(SELECT qualified_name FROM gone))
+                                   OR callee_qn = ANY(ARRAY(SELECT qualified_name FROM gone))
+                            )
+                            SELECT count(*) FROM gone
+                            """,
+                            (filepaths[i : i + batch_size],),
+                        )
+                        deleted += cur.fetchone()[0]
+            print(f"  ✔ Deleted {deleted} chunks from {len(filepaths)} files.")
+            return deleted
+        except Exception as e:
+            print(f"⚠️ delete_by_filepaths error: {e}")
+            return 0
+        finally:
+            self._release(conn)
+
     def clear_call_edges(self):
         conn = self._conn()
         try:
@@ -614,13 +1083,12 @@ class VectorStore:
     # CallGraph 로드 
     def load_call_graph(self):
         from .models import CallGraph
-        from collections import defaultdict
 
         print("🔄 Loading call graph from PostgreSQL...")
-        all_chunks_raw = self.scroll_all()
-        nodes, edges, reverse_edges = {}, defaultdict(list), defaultdict(list)
+        nodes, edges, reverse_edges = {}, {}, {}
 
-        for row in all_chunks_raw:
+        # 행을 스트리밍하면서 바로 CodeChunk로 변환 (원본 dict 리스트를 따로 쌓지 않음)
+        for row in self.iter_all():
             qn = row.get("qualified_name", "")
             if not qn:
                 continue
@@ -639,8 +1107,11 @@ class VectorStore:
                 module_path=row.get("module_path", ""),
             )
             nodes[qn] = chunk
-            for callee in chunk.calls:    edges[qn].append(callee)
-            for caller in chunk.called_by: reverse_edges[qn].append(caller)
+            # qualified_name은 행마다 고유 → 항목별 append 대신 리스트를 그대로 할당
+            if chunk.calls:
+                edges[qn] = list(chunk.calls)
+            if chunk.called_by:
+                reverse_edges[qn] = list(chunk.called_by)
 
         print(f"  ✔ Loaded {len(nodes)} chunks from PostgreSQL")
-        return CallGraph(nodes=nodes, edges=dict(edges), reverse_edges=dict(reverse_edges))
+        return CallGraph(nodes=nodes, edges=edges, reverse_edges=reverse_edges)
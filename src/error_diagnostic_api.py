@@ -3,6 +3,8 @@
 FastAPI로 실제 서비스 제공
 """
 
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import Optional, List
@@ -11,13 +13,17 @@ from pathlib import Path
 from .error_diagnostic_engine import (
     ErrorDiagnosticEngine,
     ErrorLocation,
-    ErrorDiagnostic
+    ErrorDiagnostic,
+    diagnosis_cache_key
 )
 from .search import SmartSearchEngine
 from .llm_client import LocalLLM
 from .database import VectorStore
 from .graph_store import GraphStore
 
+# 배치 진단 시 동시에 실행할 diagnose_error 수 (LLM/DB 과부하 방지)
+BATCH_ANALYZE_CONCURRENCY = 4
+
 # ===================================================================
 # Request/Response 모델
 # ===================================================================
@@ -44,7 +50,7 @@ AttributeError: 'NoneType' object has no attribute 'upper'"""
         default=5,
         ge=1,
         le=10,
-        description="연관 코드 검색 깊이"
+        description="연관 코드 검색 깊이 (에러 지점부터 거슬러 분석할 스택 프레임 수)"
     )
 
 
@@ -58,6 +64,11 @@ class ErrorLocationResponse(BaseModel):
     error_message: str
 
 
+def _location_response(loc: ErrorLocation) -> ErrorLocationResponse:
+    """엔진 dataclass → 응답 모델 (자체 파싱 결과라 필드별 재검증 없이 직접 구성)"""
+    return ErrorLocationResponse.model_construct(**vars(loc))
+
+
 class ErrorDiagnosticResponse(BaseModel):
     """에러 진단 결과 응답"""
     success: bool
@@ -144,7 +155,7 @@ def analyze_error(request: ErrorDiagnosticRequest):
         engine = get_diagnostic_engine()
         
         # 진단 실행
-        result: ErrorDiagnostic = engine.diagnose_error(request.error_text)
+        result: ErrorDiagnostic = engine.diagnose_error(request.error_text, limit=request.search_depth)
         
         # 에러 심각도 분류
         severity = engine.parser.classify_error_severity(
@@ -152,29 +163,31 @@ def analyze_error(request: ErrorDiagnosticRequest):
         )
         
         # 관련 파일 목록 추출
+        # dict.fromkeys: 한 번의 순회로 중복 제거 + 등장 순서 유지 (응답 순서가 요청마다 일정)
         related_files = []
         if result.call_chain:
-            related_files = list(set(
+            related_files = list(dict.fromkeys(
                 loc.filepath for loc in result.call_chain
             ))
         elif result.related_code:
-            related_files = list(set(
-                chunk.get('chunk', {}).get('filepath', '')
+            related_files = list(dict.fromkeys(
+                filepath
                 for chunk in result.related_code
+                if (filepath := chunk.get('chunk', {}).get('filepath'))
             ))
         
         # 응답 구성
         return ErrorDiagnosticResponse(
             success=True,
-            error_location=ErrorLocationResponse(**result.error_location.__dict__),
+            error_location=_location_response(result.error_location),
             root_cause=(
-                ErrorLocationResponse(**result.root_cause.__dict__)
+                _location_response(result.root_cause)
                 if result.root_cause else None
             ),
             diagnosis=result.diagnosis,
             severity=severity,
             call_chain=(
-                [ErrorLocationResponse(**loc.__dict__) for loc in result.call_chain]
+                [_location_response(loc) for loc in result.call_chain]
                 if result.call_chain else None
             ),
             related_files=related_files if related_files else None,
@@ -295,23 +308,43 @@ async def batch_analyze_errors(request: BatchDiagnosticRequest):
     """
     try:
         engine = get_diagnostic_engine()
+        # 정규화 해시가 같은 에러(주소/PID/임시 경로만 다른 반복)는 한 번만 진단 (순서 유지)
+        keys = [diagnosis_cache_key(text) for text in request.errors]
+        groups = {}
+        for key, text in zip(keys, request.errors):
+            groups.setdefault(key, text)
+        unique_keys = list(groups)
+        unique_errors = list(groups.values())
+        # 에러별 검색 질의 임베딩을 한 번의 배치로 계산해 두고 각 진단에서 재사용
+        await asyncio.to_thread(engine.prefetch_search_embeddings, unique_errors)
+        
+        sem = asyncio.Semaphore(BATCH_ANALYZE_CONCURRENCY)
+        
+        async def _one(error_text: str) -> dict:
+            # 블로킹 진단(검색 + LLM)을 스레드로 넘겨 이벤트 루프를 막지 않음
+            async with sem:
+                try:
+                    # diagnose_error는 LLM 응답까지 문자열로 확정해 반환 → 비싼 구간 전체가 세마포어 안에서 실행됨
+                    diagnostic = await asyncio.to_thread(engine.diagnose_error, error_text)
+                    diagnosis = diagnostic.diagnosis
+                    return {
+                        "success": True,
+                        "location": diagnostic.error_location.__dict__,
+                        "diagnosis_summary": diagnosis[:200] + "..." if len(diagnosis) > 200 else diagnosis
+                    }
+                except Exception as e:
+                    return {
+                        "success": False,
+                        "error": str(e)
+                    }
+        
+        outcomes = await asyncio.gather(*[_one(text) for text in unique_errors])
+        by_key = dict(zip(unique_keys, outcomes))
         
-        results = []
-        for idx, error_text in enumerate(request.errors):
-            try:
-                diagnostic = engine.diagnose_error(error_text)
-                results.append({
-                    "index": idx,
-                    "success": True,
-                    "location": diagnostic.error_location.__dict__,
-                    "diagnosis_summary": diagnostic.diagnosis[:200] + "..."
-                })
-            except Exception as e:
-                results.append({
-                    "index": idx,
-                    "success": False,
-                    "error": str(e)
-                })
+        results = [
+            {"index": idx, **by_key[key]}
+            for idx, key in enumerate(keys)
+        ]
         
         return {
             "total": len(request.errors),
@@ -3,7 +3,10 @@
 트레이스백 파싱 → 코드 검색 → LLM 분석
 """
 
+import hashlib
 import re
+import threading
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, List
@@ -11,6 +14,53 @@ from .search_engine import SmartSearchEngine
 from .llm import LocalLLM
 
 
+# 트레이스백 정규식은 요청마다 re 모듈 캐시를 거치지 않도록 모듈 로드 시 한 번만 컴파일
+_PY_ERROR_RE = re.compile(r'([A-Z][a-zA-Z]+Error|[A-Z][a-zA-Z]+Exception):\s*(.+?)(?:\n|$)')
+_PY_STACK_RE = re.compile(r'File "([^"]+)",\s*line\s*(\d+),\s*in\s*(\S+)')
+_CS_ERROR_RE = re.compile(r'(System\.[A-Z][a-zA-Z]+Exception|[A-Z][a-zA-Z]+Exception):\s*(.+?)(?:\n|$)')
+_CS_STACK_RE = re.compile(r'at\s+([^\s]+)\s+in\s+([^:]+):line\s+(\d+)')
+
+# 트레이스백에서 추출할 최대 프레임 수 (깊은 재귀 등 수천 프레임짜리 입력의 파싱/할당 비용 상한)
+MAX_TRACEBACK_FRAMES = 64
+
+# LocalLLM이 통신 실패 시 스트림에 넣는 문구 → 이런 진단은 캐시하지 않음 (다음 요청에서 재시도)
+_LLM_ERROR_MARKER = "[LLM 통신 오류]"
+
+# 호출 체인 시각화용 들여쓰기 (프레임 수 상한만큼 미리 생성 → 프레임마다 '  ' * i 재할당 없음)
+_INDENTS = tuple('  ' * i for i in range(MAX_TRACEBACK_FRAMES))
+
+# 진단 캐시 키 정규화: 실행마다 달라지는 메모리 주소/PID/임시 경로를 지워 같은 에러가 같은 키가 되도록 함
+_HEX_ADDR_RE = re.compile(r'0x[0-9a-fA-F]+')
+_PID_RE = re.compile(r'\b(pid|process|thread)([\s=:#]*)\d+', re.IGNORECASE)
+_TMP_PATH_RE = re.compile(r'/tmp/[^/\s"]+')
+
+# Python 트레이스백 헤더
+_PY_TB_MARKER = "Traceback (most recent call last):"
+
+# C# 스택 트레이스 특징 문자열 + .cs 파일 언급을 하나의 교대 패턴으로 묶어 텍스트를 한 번만 스캔
+_CSHARP_MARKER_RE = re.compile(
+    r"at System\."
+    r"|at Microsoft\."
+    r"|System\.Exception:"
+    r"|   at "  # C# 스택 트레이스 들여쓰기
+    r"|\.cs:line"
+    r"|\.cs'"
+)
+
+
+def normalize_traceback(error_text: str) -> str:
+    """표면적으로만 다른 반복 트레이스백이 같아지도록 정규화"""
+    text = _HEX_ADDR_RE.sub('0x?', error_text)
+    text = _PID_RE.sub(r'\1\2?', text)
+    text = _TMP_PATH_RE.sub('/tmp/?', text)
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+
+def diagnosis_cache_key(error_text: str) -> str:
+    """정규화된 트레이스백의 blake2b 해시 (진단 캐시 / 배치 그룹핑 키)"""
+    return hashlib.blake2b(normalize_traceback(error_text).encode("utf-8"), digest_size=16).hexdigest()
+
+
 @dataclass
 class ErrorLocation:
     """에러 발생 위치 정보"""
@@ -72,47 +122,35 @@ class ErrorTracebackParser:
     
     def classify_error_severity(self, error_type: str) -> str:
         """에러 심각도 분류"""
-        # Python 에러 체크
-        if error_type in self.COMMON_ERRORS:
-            return self.COMMON_ERRORS[error_type]
-        # C# 에러 체크
-        if error_type in self.CSHARP_ERRORS:
-            return self.CSHARP_ERRORS[error_type]
-        return "Level2"  # 기본값
+        # Python 에러 → C# 에러 → 기본값 순으로 dict 조회 한 번씩
+        return self.COMMON_ERRORS.get(error_type) or self.CSHARP_ERRORS.get(error_type, "Level2")
     
     def detect_language(self, traceback_text: str) -> str:
         """트레이스백에서 언어 감지"""
         # Python 트레이스백 특징
-        if "Traceback (most recent call last):" in traceback_text:
+        if traceback_text.find(_PY_TB_MARKER) != -1:
             return "python"
         
-        # C# 트레이스백 특징
-        if any(marker in traceback_text for marker in [
-            "at System.", 
-            "at Microsoft.",
-            "System.Exception:",
-            "   at ",  # C# 스택 트레이스 들여쓰기
-        ]):
-            return "csharp"
-        
-        # .cs 파일 언급
-        if ".cs:line" in traceback_text or ".cs'" in traceback_text:
+        # C# 트레이스백 특징 / .cs 파일 언급 (단일 정규식 스캔, 첫 매치에서 종료)
+        if _CSHARP_MARKER_RE.search(traceback_text):
             return "csharp"
         
         return "python"  # 기본값
     
-    def parse_traceback(self, error_text: str) -> List[ErrorLocation]:
+    def parse_traceback(self, error_text: str, limit: Optional[int] = None) -> List[ErrorLocation]:
         """
         언어 자동 감지 후 적절한 파서 호출
+        limit: 마지막 N개 프레임만 추출 (에러 발생 지점인 마지막 프레임은 항상 포함, 최대 MAX_TRACEBACK_FRAMES)
         """
+        limit = min(limit or MAX_TRACEBACK_FRAMES, MAX_TRACEBACK_FRAMES)
         language = self.detect_language(error_text)
         
         if language == "csharp":
-            return self._parse_csharp_traceback(error_text)
+            return self._parse_csharp_traceback(error_text, limit)
         else:
-            return self._parse_python_traceback(error_text)
+            return self._parse_python_traceback(error_text, limit)
     
-    def _parse_python_traceback(self, error_text: str) -> List[ErrorLocation]:
+    def _parse_python_traceback(self, error_text: str, limit: int = MAX_TRACEBACK_FRAMES) -> List[ErrorLocation]:
         """
         Python 트레이스백 파싱
         
@@ -127,31 +165,28 @@ class ErrorTracebackParser:
         locations = []
         
         # 1. 에러 타입 및 메시지 추출
-        error_match = re.search(
-            r'([A-Z][a-zA-Z]+Error|[A-Z][a-zA-Z]+Exception):\s*(.+?)(?:\n|$)', 
-            error_text
-        )
+        error_match = _PY_ERROR_RE.search(error_text)
         
         error_type = error_match.group(1) if error_match else "UnknownError"
         error_message = error_match.group(2).strip() if error_match else "Unknown error"
         
         # 2. 스택 프레임 추출
         # 패턴: File "파일명", line 번호, in 함수명
-        stack_pattern = r'File "([^"]+)",\s*line\s*(\d+),\s*in\s*(\S+)'
-        matches = re.finditer(stack_pattern, error_text)
+        # 줄 단위로 한 번만 훑으며 프레임을 찾고, 바로 다음 줄을 코드 스니펫으로 사용
+        # 프레임 위치만 먼저 모아 마지막 limit개만 남긴 뒤 ErrorLocation 생성
+        lines = error_text.split('\n')
+        frames = deque(
+            ((i, match) for i, match in enumerate(map(_PY_STACK_RE.search, lines)) if match),
+            maxlen=limit,
+        )
         
-        for match in matches:
+        for i, match in frames:
             filepath = match.group(1)
             line_num = int(match.group(2))
             func_name = match.group(3)
             
             # 코드 스니펫 추출 (다음 줄에 있는 실제 코드)
-            code_snippet = ""
-            lines = error_text.split('\n')
-            for i, line in enumerate(lines):
-                if match.group(0) in line and i + 1 < len(lines):
-                    code_snippet = lines[i + 1].strip()
-                    break
+            code_snippet = lines[i + 1].strip() if i + 1 < len(lines) else ""
             
             locations.append(ErrorLocation(
                 filepath=filepath,
@@ -165,7 +200,7 @@ class ErrorTracebackParser:
         
         return locations
     
-    def _parse_csharp_traceback(self, error_text: str) -> List[ErrorLocation]:
+    def _parse_csharp_traceback(self, error_text: str, limit: int = MAX_TRACEBACK_FRAMES) -> List[ErrorLocation]:
         """
         C# 트레이스백 파싱
         
@@ -177,10 +212,7 @@ class ErrorTracebackParser:
         locations = []
         
         # 1. 에러 타입 및 메시지 추출
-        error_match = re.search(
-            r'(System\.[A-Z][a-zA-Z]+Exception|[A-Z][a-zA-Z]+Exception):\s*(.+?)(?:\n|$)',
-            error_text
-        )
+        error_match = _CS_ERROR_RE.search(error_text)
         
         if error_match:
             error_type = error_match.group(1).split('.')[-1]  # System.NullReferenceException -> NullReferenceException
@@ -191,8 +223,7 @@ class ErrorTracebackParser:
         
         # 2. 스택 프레임 추출
         # 패턴: at Namespace.Class.Method() in 파일경로:line 번호
-        stack_pattern = r'at\s+([^\s]+)\s+in\s+([^:]+):line\s+(\d+)'
-        matches = re.finditer(stack_pattern, error_text)
+        matches = deque(_CS_STACK_RE.finditer(error_text), maxlen=limit)
         
         for match in matches:
             full_method = match.group(1)  # TIDAL.ViewModels.ExperimentViewModel.LoadData()
@@ -223,6 +254,9 @@ class ErrorDiagnosticEngine:
     에러 자동 진단 엔진 (Multi-language)
     """
     
+    # 같은 트레이스백이 반복될 때(로그, CI 재실행) LLM 호출 두 번을 건너뛰기 위한 진단 LRU 크기
+    DIAGNOSIS_CACHE_SIZE = 512
+    
     def __init__(
         self,
         search_engine: SmartSearchEngine,
@@ -233,8 +267,28 @@ class ErrorDiagnosticEngine:
         self.llm = llm_client
         self.repo_root = repo_root or Path.cwd()
         self.parser = ErrorTracebackParser()
+        self._diagnosis_cache: OrderedDict[tuple, ErrorDiagnostic] = OrderedDict()
+        self._diagnosis_lock = threading.Lock()
     
-    def diagnose_error(self, error_text: str) -> ErrorDiagnostic:
+    @staticmethod
+    def _search_query(error_location: ErrorLocation) -> str:
+        """에러 발생 위치 코드 검색용 질의"""
+        return f"{error_location.filepath} {error_location.function_name}"
+    
+    def prefetch_search_embeddings(self, error_texts: List[str]):
+        """
+        여러 에러를 연달아 진단할 때 각 검색 질의의 임베딩을 한 번의 배치로 미리 계산
+        (이후 diagnose_error의 검색은 VectorStore 질의 임베딩 캐시를 사용)
+        """
+        queries = []
+        for error_text in error_texts:
+            locations = self.parser.parse_traceback(error_text)
+            if locations:
+                queries.append(self._search_query(locations[-1]))
+        if queries:
+            self.search.db.prefetch_query_embeddings(queries)
+    
+    def diagnose_error(self, error_text: str, limit: Optional[int] = None) -> ErrorDiagnostic:
         """
         에러 진단 메인 로직
         
@@ -242,9 +296,31 @@ class ErrorDiagnosticEngine:
         2. 에러 위치 코드 검색
         3. 호출 체인 추적 (그래프)
         4. LLM 분석
+        
+        정규화된 트레이스백 해시가 같은 진단은 캐시에서 바로 반환
         """
+        cache_key = (diagnosis_cache_key(error_text), limit)
+        with self._diagnosis_lock:
+            cached = self._diagnosis_cache.get(cache_key)
+            if cached is not None:
+                self._diagnosis_cache.move_to_end(cache_key)
+                return cached
+        
+        diagnostic = self._diagnose(error_text, limit)
+        if _LLM_ERROR_MARKER in diagnostic.diagnosis or _LLM_ERROR_MARKER in (diagnostic.fix_suggestion or ""):
+            return diagnostic
+        
+        with self._diagnosis_lock:
+            self._diagnosis_cache[cache_key] = diagnostic
+            self._diagnosis_cache.move_to_end(cache_key)
+            while len(self._diagnosis_cache) > self.DIAGNOSIS_CACHE_SIZE:
+                self._diagnosis_cache.popitem(last=False)
+        return diagnostic
+    
+    def _diagnose(self, error_text: str, limit: Optional[int]) -> ErrorDiagnostic:
+        """캐시 미스 시 실제 진단 (파싱 → 검색 → LLM 2회)"""
         # Step 1: 트레이스백 파싱
-        locations = self.parser.parse_traceback(error_text)
+        locations = self.parser.parse_traceback(error_text, limit=limit)
         
         if not locations:
             raise ValueError("트레이스백을 파싱할 수 없습니다.")
@@ -252,7 +328,7 @@ class ErrorDiagnosticEngine:
         error_location = locations[-1]  # 실제 에러 발생 지점 (마지막)
         
         # Step 2: 에러 발생 위치 코드 검색
-        search_query = f"{error_location.filepath} {error_location.function_name}"
+        search_query = self._search_query(error_location)
         related_code = self.search.search(search_query, top_k=10)
         
         # Step 3: 호출 체인 구성 (역순으로)
@@ -300,19 +376,21 @@ class ErrorDiagnosticEngine:
         # 1. 에러 위치 코드
         for item in related_code[:5]:
             chunk = item.get('chunk', {})
+            language = chunk.get('language')
             context_parts.append(f"""
 ## {chunk.get('qualified_name', 'Unknown')}
 **File**: {chunk.get('filepath', '')}:{chunk.get('start_line', '')}
-**Language**: {chunk.get('language', 'unknown')}
+**Language**: {language or 'unknown'}
 
-```{chunk.get('language', '')}
+```{language or ''}
 {chunk.get('content', '')}
 ```
 """)
         
         # 2. 호출 체인 시각화
+        last_indent = len(_INDENTS) - 1
         chain_visual = "\n".join([
-            f"{'  ' * i}→ {loc.function_name} ({loc.filepath}:{loc.line_number})"
+            f"{_INDENTS[min(i, last_indent)]}→ {loc.function_name} ({loc.filepath}:{loc.line_number})"
             for i, loc in enumerate(call_chain)
         ])
         
@@ -344,7 +422,8 @@ class ErrorDiagnosticEngine:
 3. 왜 이 에러가 발생했는지 설명
 """
         
-        return self.llm.generate_response(system_prompt, "위 에러를 분석해주세요.")
+        # generate_response는 스트리밍 제너레이터 → 여기서 소비해 문자열로 확정 (캐시/슬라이싱 가능)
+        return "".join(self.llm.generate_response(system_prompt, "위 에러를 분석해주세요."))
     
     def _generate_fix_suggestion(
         self,
@@ -376,4 +455,4 @@ class ErrorDiagnosticEngine:
 2. 예방 방법
 """
         
-        return self.llm.generate_response(system_prompt, "이 에러를 어떻게 고칠 수 있나요?")
\ No newline at end of file
+        return "".join(self.llm.generate_response(system_prompt, "이 에러를 어떻게 고칠 수 있나요?"))
\ No newline at end of file
@@ -88,6 +88,22 @@ class GraphStore:
         except Exception:
             return []
 
+    def get_callees_batch(self, qualified_names: list[str]) -> dict[str, list[str]]:
+        """여러 함수의 callee를 한 번의 쿼리로 조회 (qualified_name → callee 목록)"""
+        if not self.driver or not qualified_names: return {}
+
+        query = """
+        UNWIND $names AS name
+        MATCH (caller:Function {qualified_name: name})-[:CALLS]->(callee:Function)
+        RETURN name, collect(callee.qualified_name) as qns
+        """
+        try:
+            with self.driver.session() as session:
+                result = session.run(query, names=list(qualified_names))
+                return {record["name"]: record["qns"] for record in result}
+        except Exception:
+            return {}
+
     def clear_all_data(self):
         """Memgraph의 모든 노드와 관계를 삭제하여 초기화합니다."""
         if not self.driver:
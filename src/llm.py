@@ -2,26 +2,76 @@
 import os
 import requests
 import json
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# 모델을 메모리에 유지해 고정 system 프롬프트의 KV 캐시(prefix)가 호출 간 재사용되도록 함
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# 단일 시퀀스 디코딩은 가중치 메모리 대역폭이 병목 → FP16/FP32 가중치 모델이면 4비트(Q4_K_M 등) 태그 사용 권장
+# (KV 캐시는 품질 손실이 커서 FP16 유지: Ollama 서버 기본값)
+UNQUANTIZED_LEVELS = frozenset({"F32", "F16", "BF16"})
+
+# 시작 시 모델을 미리 메모리에 올려 첫 질문의 콜드 스타트(디스크 → GPU 가중치 로딩) 제거
+OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "true").lower() == "true"
+
 class LocalLLM:
     def __init__(self):
         self.api_url = os.getenv("OLLAMA_URL")
         self.model = os.getenv("LLM_MODEL")
         self.fast_model = os.getenv("FAST_LLM_MODEL") # 🌟 빠른 모델 추가
+        self._check_quantization()
+        if OLLAMA_PRELOAD:
+            # 로딩은 수십 초가 걸릴 수 있으므로 백그라운드에서 (첫 요청은 Ollama 쪽에서 로딩 완료까지 대기)
+            threading.Thread(target=self._preload, daemon=True).start()
+
+    def _preload(self):
+        """prompt 없는 generate 요청 → Ollama가 양자화된 GGUF 가중치를 mmap으로 올리고 keep_alive 동안 유지"""
+        if not self.api_url or "/api/" not in self.api_url:
+            return
+        for model in dict.fromkeys(m for m in (self.model, self.fast_model) if m):
+            try:
+                requests.post(
+                    self.api_url, json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE}, timeout=500
+                ).raise_for_status()
+                print(f"🔥 {model} 모델 로딩 완료")
+            except Exception as e:
+                print(f"⚠️ 모델 사전 로딩 실패 ({model}): {e}")
+
+    def _check_quantization(self):
+        """Ollama /api/show로 모델 가중치 양자화 수준을 확인하고, 비양자화 모델이면 경고"""
+        if not self.api_url or "/api/" not in self.api_url:
+            return
+        show_url = self.api_url.rsplit("/api/", 1)[0] + "/api/show"
+        for model in dict.fromkeys(m for m in (self.model, self.fast_model) if m):
+            try:
+                response = requests.post(show_url, json={"model": model}, timeout=5)
+                response.raise_for_status()
+                level = response.json().get("details", {}).get("quantization_level", "")
+            except Exception as e:
+                print(f"⚠️ 모델 정보 조회 실패 ({model}): {e}")
+                continue
+            if level.upper() in UNQUANTIZED_LEVELS:
+                print(f"⚠️ {model}: {level} 가중치 → 디코딩이 메모리 대역폭에 묶임. ':q4_K_M' 등 4비트 양자화 태그 사용 권장")
+            elif level:
+                print(f"🧮 {model}: {level} 양자화 가중치")
 
     # 🌟 use_fast=False 파라미터 추가 (기본값은 무거운 30b 모델)
-    def generate_response(self, system_prompt: str, user_query: str, use_fast: bool = False):
+    # response_format: Ollama 'format' 필드 ("json" 또는 JSON Schema dict) → 디코딩 단계에서 출력 형식 강제
+    def generate_response(self, system_prompt: str, user_query: str, use_fast: bool = False, response_format=None):
         
         # 스위치에 따라 사용할 모델 결정
         target_model = self.fast_model if use_fast else self.model
         
         payload = {
             "model": target_model, # 🌟 결정된 모델 주입
-            "prompt": f"{system_prompt}\n\nUser Question: {user_query}",
+            # system/user 분리: 매 호출 동일한 system 프롬프트가 항상 앞쪽 고정 prefix로 인코딩됨
+            "system": system_prompt,
+            "prompt": f"User Question: {user_query}",
             "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
             "options": {
                 "temperature": 0.1,
                 "num_ctx": 16384, 
@@ -30,36 +80,39 @@ class LocalLLM:
                 "num_predict": 8192,
             }
         }
+        if response_format:
+            payload["format"] = response_format
         
         try:
-            response = requests.post(self.api_url, json=payload, stream=True, timeout=500)
-            response.raise_for_status()
+            # with 블록: 소비자가 제너레이터를 닫으면 스트림 연결도 즉시 종료
+            with requests.post(self.api_url, json=payload, stream=True, timeout=500) as response:
+                response.raise_for_status()
             
-            buffer = ""
-            for line in response.iter_lines():
-                if line:
-                    chunk = json.loads(line)
-                    token = chunk.get("response", "")
-                    buffer += token
+                buffer = ""
+                for line in response.iter_lines():
+                    if line:
+                        chunk = json.loads(line)
+                        token = chunk.get("response", "")
+                        buffer += token
                     
-                    if "<thinking>" in buffer:
-                        buffer = buffer.replace("<thinking>", "\n> 🧠 **[코드 분석 중...]**\n> ")
-                    if "</thinking>" in buffer:
-                        buffer = buffer.replace("</thinking>", "\n\n**[분석 완료]**\n\n")
+                        if "<thinking>" in buffer:
+                            buffer = buffer.replace("<thinking>", "\n> 🧠 **[코드 분석 중...]**\n> ")
+                        if "</thinking>" in buffer:
+                            buffer = buffer.replace("</thinking>", "\n\n**[분석 완료]**\n\n")
 
-                    is_done = chunk.get("done", False)
+                        is_done = chunk.get("done", False)
 
-                    if not is_done and "<" in buffer:
-                        last_bracket_idx = buffer.rfind("<")
-                        possible_tag = buffer[last_bracket_idx:]
-                        if "<thinking>".startswith(possible_tag) or "</thinking>".startswith(possible_tag):
-                            continue 
+                        if not is_done and "<" in buffer:
+                            last_bracket_idx = buffer.rfind("<")
+                            possible_tag = buffer[last_bracket_idx:]
+                            if "<thinking>".startswith(possible_tag) or "</thinking>".startswith(possible_tag):
+                                continue 
                             
-                    yield buffer
-                    buffer = ""
+                        yield buffer
+                        buffer = ""
 
-                    if is_done:
-                        break
+                        if is_done:
+                            break
 
         except Exception as e:
             yield f"\n\n[LLM 통신 오류]: {str(e)}"
\ No newline at end of file
@@ -2,7 +2,8 @@
 from dataclasses import dataclass, field
 
 
-@dataclass
+# slots: 청크가 수만 개 생성되고 파싱 워커 → 부모 프로세스로 pickle 전송되므로 인스턴스 __dict__ 제거
+@dataclass(slots=True)
 class CodeChunk:
     name: str
     type: str  # function, class
@@ -29,7 +30,7 @@ class CodeChunk:
     summary: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class CallGraph:
     nodes: dict[str, CodeChunk]
     edges: dict[str, list[str]]
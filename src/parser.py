@@ -468,7 +468,12 @@ class ASTParser:
                 # 호출 관계 추출
                 extracted_calls = []
                 if ext == ".py" and ext in self.call_extractors:
-                    extracted_calls = self.call_extractors[ext].extract_calls(raw_code)
+                    if node_type in ("class", "struct"):
+                        # 클래스는 메서드 본문이 치환된 껍데기 코드 기준으로 추출
+                        extracted_calls = self.call_extractors[ext].extract_calls(raw_code)
+                    else:
+                        # 파일 전체 트리를 이미 가지고 있으므로 청크 코드를 다시 파싱하지 않음
+                        extracted_calls = self.call_extractors[ext].extract_calls_from_node(node, code_bytes)
                 elif ext == ".cs" and self.csharp_call_query:
                     call_captures = self.csharp_call_query.captures(node)
                     for call_node, tag in call_captures:
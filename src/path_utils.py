@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 
 # 무시할 폴더 및 파일 목록
@@ -12,14 +13,23 @@ IGNORE_FILES = {
     '.DS_Store', 'poetry.lock', 'package-lock.json', '.gitignore'
 }
 
-def should_skip_path(path: Path, root_path: Path) -> bool:
+@lru_cache(maxsize=4096)
+def should_skip_name(name: str) -> bool:
+    """파일/폴더 이름만으로 제외 여부 판단 (상위 경로가 이미 검사된 순회에서 사용)"""
 
     # 1. 파일/폴더 이름 자체가 무시 목록에 있는 경우
-    if path.name in IGNORE_DIRS or path.name in IGNORE_FILES:
+    if name in IGNORE_DIRS or name in IGNORE_FILES:
         return True
     
     # 2. 숨김 파일/폴더 
-    if path.name.startswith('.') and path.name != '.':
+    if name.startswith('.') and name != '.':
+        return True
+
+    return False
+
+def should_skip_path(path: Path, root_path: Path) -> bool:
+
+    if should_skip_name(path.name):
         return True
 
     # 3. 경로 중간에 무시할 디렉토리가 포함된 경우
@@ -1,3 +1,4 @@
+import io
 from pathlib import Path
 from .source_extraction import extract_source_lines
 
@@ -57,11 +58,16 @@ Use <thinking> to analyze, then answer clearly in polite Korean.
 # 🧱 Context Builders (XML Style)
 # ===================================================================
 
+# 청크 하나당 컨텍스트에 넣을 최대 문자 수 (LLM prefill 비용 제한)
+MAX_SNIPPET_CHARS = 4096
+
 def format_context_xml(results: list) -> str:
     """
     검색 결과를 XML 형식으로 변환 (언어 구분 명시)
     """
-    xml_context = "<context>\n"
+    # 청크마다 문자열을 이어붙이지 않고 버퍼에 한 번씩만 기록
+    buf = io.StringIO()
+    buf.write("<context>\n")
     
     for idx, item in enumerate(results, 1):
         if isinstance(item, dict) and 'chunk' in item:
@@ -81,15 +87,20 @@ def format_context_xml(results: list) -> str:
         else:
             continue
 
-        xml_context += f"""
+        # 거대한 청크 하나가 컨텍스트 윈도우를 다 차지하지 않도록 길이 제한 (결과는 이미 관련도 순)
+        content = content or ''
+        if len(content) > MAX_SNIPPET_CHARS:
+            content = content[:MAX_SNIPPET_CHARS] + "\n... (truncated)"
+
+        buf.write(f"""
     <file index="{idx}" path="{filepath}" start_line="{start_line}" language="{language}" type="{chunk_type}">
 <![CDATA[
 {content}
 ]]>
     </file>
-"""
-    xml_context += "</context>"
-    return xml_context
+""")
+    buf.write("</context>")
+    return buf.getvalue()
 
 # 호환성 유지
 def build_file_context(results: list) -> str:
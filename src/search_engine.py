@@ -3,91 +3,113 @@ Memgraph 기반의 하이브리드 검색 엔진
 Vector(의미 검색) + BM25(키워드 검색) + Graph(맥락/흐름 검색)
 🆕 C# + XAML 지원 추가
 """
+import os
 import re
+import time
+import pickle
+import threading
+from pathlib import Path
+from typing import Optional
 from rank_bm25 import BM25Okapi
-from qdrant_client.models import Filter, FieldCondition, MatchText, MatchAny
 from .database import VectorStore
 from .graph_store import GraphStore
 from loguru import logger
 
+# BM25 인덱스 디스크 캐시: 인제스트 직후 미리 구축해 두고, 서버 시작 시 DB 지문이 같으면 재토큰화 없이 로드
+# (토크나이저/캐시 형식을 바꾸면 버전을 올려 기존 캐시 무효화)
+BM25_CACHE_VERSION = 1
+BM25_CACHE_PATH = Path(os.getenv("BM25_CACHE_PATH", ".ingest_cache/bm25_index.pkl"))
+# 장기 실행 서버(app.py 등)에서 DB 지문을 다시 확인하는 최소 간격(초) → 실행 중 인제스트된 청크를 BM25/정확 매칭에 반영
+BM25_REFRESH_INTERVAL = float(os.getenv("BM25_REFRESH_INTERVAL", 30))
+
 class SmartSearchEngine:
 
     def __init__(self, vector_store: VectorStore, graph_store: GraphStore):
         self.db = vector_store
         self.graph = graph_store
         
-        # BM25 인덱스 초기화
+        # BM25 인덱스 초기화 (디스크 캐시 우선)
         logger.info("⏳ Initializing BM25 Index from Vector Store...")
         
-        self.all_chunks = self._fetch_all_docs_from_db()
+        self._refresh_lock = threading.Lock()
+        self._fingerprint = self.db.corpus_fingerprint()
+        self._checked_at = time.monotonic()
+        # (all_chunks, bm25)를 한 튜플로 교체 → 갱신 중에도 검색이 서로 다른 버전의 쌍을 보지 않음
+        self._index = load_bm25_index(self.db, fingerprint=self._fingerprint)
         
-        if self.all_chunks:
-            tokenized_corpus = [self._tokenize_code(doc.get('content', '')) for doc in self.all_chunks]
-            self.bm25 = BM25Okapi(tokenized_corpus)
+        if self.bm25:
             logger.success(f"✅ BM25 Index Ready! (Loaded {len(self.all_chunks)} chunks)")
         else:
-            logger.warning("⚠️ No data found in Qdrant. BM25 will be disabled until data is ingested.")
-            self.bm25 = None
+            logger.warning("⚠️ No data found in PostgreSQL. BM25 will be disabled until data is ingested.")
+
+    @property
+    def all_chunks(self) -> list[dict]:
+        return self._index[0]
+
+    @property
+    def bm25(self):
+        return self._index[1]
+
+    def refresh_if_stale(self, force: bool = False):
+        """
+        BM25_REFRESH_INTERVAL마다 DB 지문을 확인해, 엔진 생성 이후 인제스트로 청크가 바뀌었으면 BM25 인덱스를 다시 로드
+        (프로세스 전역으로 캐시된 엔진이 재시작 없이 새 청크를 키워드 검색/정확 매칭에 반영)
+        """
+        if not force and time.monotonic() - self._checked_at < BM25_REFRESH_INTERVAL:
+            return
+        # 다른 스레드가 이미 확인/재로딩 중이면 기존 인덱스로 계속 검색
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            fingerprint = self.db.corpus_fingerprint()
+            if fingerprint is None or fingerprint == self._fingerprint:
+                return
+            logger.info("🔄 Corpus changed since startup, reloading BM25 index...")
+            self._index = load_bm25_index(self.db, fingerprint=fingerprint)
+            self._fingerprint = fingerprint
+            logger.success(f"✅ BM25 Index Reloaded! ({len(self.all_chunks)} chunks)")
+        finally:
+            self._refresh_lock.release()
 
-    def _tokenize_code(self, text: str):
+    @staticmethod
+    def _tokenize_code(text: str):
         """
         코드용 토크나이저: snake_case, CamelCase, 특수문자 등을 분리
         """
         clean_text = re.sub(r"[_\.\(\)\[\]\{\}\=\:\,\;\"\'\/]", " ", text)
         return clean_text.lower().split()
 
-    def _fetch_all_docs_from_db(self):
-        """Qdrant에서 모든 청크 데이터를 가져옵니다."""
+    @staticmethod
+    def _fetch_all_docs_from_db(db: VectorStore):
+        """PostgreSQL에서 모든 청크 데이터를 가져옵니다. (서버 측 커서로 페이지 단위 스트리밍)"""
         try:
-            all_points = []
-            offset = None
-            while True:
-                points, offset = self.db.client.scroll(
-                    collection_name=self.db.collection,
-                    limit=100,
-                    offset=offset,
-                    with_payload=True,
-                    with_vectors=False
-                )
-                for p in points:
-                    if p.payload:
-                        all_points.append(p.payload)
-                
-                if offset is None:
-                    break
-            return all_points
+            return db.scroll_all()
         except Exception as e:
             logger.error(f"⚠️ Failed to fetch docs for BM25: {e}")
             return []
 
-    def reciprocal_rank_fusion(self, vector_results, bm25_results, k=60):
-        """RRF 알고리즘: 두 검색 결과의 순위를 합산하여 재정렬"""
-        fusion_scores = {}
-
-        # Vector 결과 점수 매기기
-        for rank, item in enumerate(vector_results):
-            payload = item.payload if hasattr(item, 'payload') else item
-            doc_id = payload.get('qualified_name') or payload.get('filepath')
-            
-            if not doc_id: continue
-
-            if doc_id not in fusion_scores:
-                fusion_scores[doc_id] = {'doc': payload, 'score': 0}
-            fusion_scores[doc_id]['score'] += 1 / (k + rank)
+    def reciprocal_rank_fusion(self, *result_lists, k=60):
+        """
+        RRF 알고리즘: 여러 검색 결과(쿼리 변형별 벡터 결과, 벡터 + BM25 등)의 순위를 합산하여 재정렬
+        (qualified_name 기준 중복 제거, 결과 목록이 하나면 순위 그대로 반환)
+        """
+        if len(result_lists) == 1:
+            return result_lists[0]
 
-        # BM25 결과 점수 매기기
-        for rank, item in enumerate(bm25_results):
-            doc_id = item.get('qualified_name') or item.get('filepath')
-            
-            if not doc_id: continue
+        fusion_scores = {}
+        for results in result_lists:
+            for rank, item in enumerate(results):
+                payload = item.payload if hasattr(item, 'payload') else item
+                doc_id = payload.get('qualified_name') or payload.get('filepath')
+                if not doc_id: continue
 
-            if doc_id not in fusion_scores:
-                fusion_scores[doc_id] = {'doc': item, 'score': 0}
-            fusion_scores[doc_id]['score'] += 1 / (k + rank)
+                if doc_id not in fusion_scores:
+                    fusion_scores[doc_id] = {'doc': payload, 'score': 0}
+                fusion_scores[doc_id]['score'] += 1 / (k + rank)
 
         # 점수 높은 순 정렬
         sorted_results = sorted(fusion_scores.values(), key=lambda x: x['score'], reverse=True)
-        
         return [item['doc'] for item in sorted_results]
 
     def _extract_filenames(self, query: str) -> list[str]:
@@ -132,13 +154,14 @@ class SmartSearchEngine:
     
     def _get_exact_function_chunks(self, function_names: list[str]) -> list:
         """함수명과 정확히 일치하는 청크들을 직접 가져오기"""
-        if not function_names or not self.all_chunks:
+        all_chunks = self.all_chunks
+        if not function_names or not all_chunks:
             return []
         
         exact_matches = []
         seen_qns = set()
         
-        for chunk in self.all_chunks:
+        for chunk in all_chunks:
             chunk_name = chunk.get('name', '')
             qn = chunk.get('qualified_name', '')
             
@@ -155,9 +178,10 @@ class SmartSearchEngine:
         
         return exact_matches
 
-    def search(self, query: str, top_k: int = 5):
+    def search(self, query: str, top_k: int = 5, extra_queries: list[str] = None):
         """
         [하이브리드 검색 파이프라인]
+        extra_queries: 라우터가 확장한 키워드 등 추가 쿼리 변형 (벡터 검색을 한 번에 배치 처리)
         1. Exact Function Name Matching
         2. Keyword Search (BM25)
         3. Vector Search (Dense)
@@ -166,6 +190,8 @@ class SmartSearchEngine:
         6. Context Expansion (Graph)
         """
         print(f"🔎 Hybrid Searching for: '{query}'")
+        self.refresh_if_stale()
+        all_chunks, bm25 = self._index
 
         # 0. 함수명 정확 매칭
         target_functions = self._extract_function_names(query)
@@ -178,26 +204,28 @@ class SmartSearchEngine:
         
         # 1. 파일명 필터 확인
         target_files = self._extract_filenames(query)
-        search_filters = None
         if target_files:
             print(f"  📂 Filter by files: {target_files}")
-            search_filters = Filter(
-                should=[
-                    FieldCondition(
-                        key="filepath", 
-                        match=MatchText(text=fname)
-                    ) for fname in target_files
-                ]
-            )
 
-        # 2. Vector Search
-        vector_candidates = self.db.search(query, top_k=top_k * 4, query_filter=search_filters)
+        # 2. Vector Search (원본 쿼리 + 확장 쿼리를 단일 배치로 검색 후 RRF 병합)
+        query_variants = [query]
+        for q in extra_queries or []:
+            if q and q not in query_variants:
+                query_variants.append(q)
+
+        vector_candidates = self.reciprocal_rank_fusion(
+            *self.db.search_batch(
+                query_variants,
+                top_k=top_k * 4,
+                filepath_keywords=target_files or None,
+            )
+        )
         
         # 3. Keyword Search (BM25)
         bm25_candidates = []
-        if self.bm25:
+        if bm25:
             tokenized_query = self._tokenize_code(query)
-            bm25_candidates = self.bm25.get_top_n(tokenized_query, self.all_chunks, n=top_k * 4)
+            bm25_candidates = bm25.get_top_n(tokenized_query, all_chunks, n=top_k * 4)
 
         # 4. RRF Fusion
         print(f"  🧬 Fusing: Vector({len(vector_candidates)}) + BM25({len(bm25_candidates)})")
@@ -270,16 +298,7 @@ class SmartSearchEngine:
         """
         print(f"🔍 Searching {language.upper()} code for: '{query}'")
         
-        language_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="language",
-                    match=MatchText(text=language)
-                )
-            ]
-        )
-        
-        results = self.db.search(query, top_k=top_k, query_filter=language_filter)
+        results = self.db.search(query, top_k=top_k, language=language)
         
         # Payload 추출
         payloads = [
@@ -291,4 +310,44 @@ class SmartSearchEngine:
             "chunk": p,
             "flow_context": [],
             "related_code": []
-        } for p in payloads]
\ No newline at end of file
+        } for p in payloads]
+
+def load_bm25_index(db: VectorStore, rebuild: bool = False, fingerprint: Optional[str] = None):
+    """
+    (all_chunks, bm25) 반환. 캐시의 DB 지문이 현재와 같으면 pickle에서 바로 로드하고,
+    다르면(또는 rebuild) 전체 청크를 읽어 재구축한 뒤 캐시를 갱신합니다.
+    fingerprint: 호출자가 이미 조회한 지문 (없으면 여기서 조회)
+    """
+    if fingerprint is None:
+        fingerprint = db.corpus_fingerprint()
+    if fingerprint is not None and not rebuild and BM25_CACHE_PATH.exists():
+        try:
+            with open(BM25_CACHE_PATH, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") == BM25_CACHE_VERSION and cached.get("fingerprint") == fingerprint:
+                return cached["chunks"], cached["bm25"]
+        except Exception as e:
+            logger.warning(f"⚠️ BM25 cache unreadable, rebuilding: {e}")
+
+    all_chunks = SmartSearchEngine._fetch_all_docs_from_db(db)
+    if not all_chunks:
+        return [], None
+
+    tokenized_corpus = [SmartSearchEngine._tokenize_code(doc.get('content', '')) for doc in all_chunks]
+    bm25 = BM25Okapi(tokenized_corpus)
+
+    if fingerprint is not None:
+        try:
+            BM25_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = BM25_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(
+                    {"version": BM25_CACHE_VERSION, "fingerprint": fingerprint, "chunks": all_chunks, "bm25": bm25},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, BM25_CACHE_PATH)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to write BM25 cache: {e}")
+
+    return all_chunks, bm25